@@ -8,37 +8,32 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
 from flask_cors import CORS
+from app.state import create_state_store
+from app.broadcast import FrameJSON
+from app.engine import engine_options, configure_engine, green_driver
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.logger.setLevel(app.config['LOG_LEVEL'])
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+green_driver(app.config, app.logger)
 db = SQLAlchemy(app)
+with app.app_context():
+    configure_engine(db.engine, app.config)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# The message queue relays room broadcasts between workers when more than one is running.
+# FrameJSON lets pre-encoded question frames go out without being encoded again.
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+                    json=FrameJSON)
+# Shared game counters, see app/state.py
+state = create_state_store(app.config['STATE_STORE_URL'])
 
 # Enable CORS for the entire app
 CORS(app, resources={r"/*": {"origins": "*"}})
 app.config['CORS_HEADERS'] = 'Content-Type'
 
-@socketio.on('connect')
-def test_connect():
-    print('Client connected')
-
-@socketio.on('disconnect')
-def test_disconnect():
-    try:
-        print('Client disconnected')
-    except Exception as e:
-        print(f"Error during disconnect: {str(e)}")
-
-blacklist = set()
-
-@jwt.token_in_blocklist_loader
-def check_if_token_in_blacklist(jwt_header, jwt_payload):
-    jti = jwt_payload['jti']
-    return jti in blacklist
-
-from app import routes, models, events
+from app import routes, models, events, revocation, metrics
 
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
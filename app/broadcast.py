@@ -0,0 +1,43 @@
+import json
+from collections import OrderedDict
+
+# Socket.IO JSON-encodes every emit. Payloads that are broadcast over and over
+# (question frames) are encoded once up front and wrapped in PreEncoded, which
+# FrameJSON splices into the packet as-is instead of encoding them again.
+
+class PreEncoded(str):
+    pass
+
+def pre_encode(data):
+    return PreEncoded(json.dumps(data, separators=(',', ':')))
+
+class FrameJSON(object):
+    # json module handed to SocketIO
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        if isinstance(obj, list) and any(isinstance(item, PreEncoded) for item in obj):
+            return '[' + ','.join(item if isinstance(item, PreEncoded) else json.dumps(item, *args, **kwargs)
+                                  for item in obj) + ']'
+        return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
+
+class FrameCache(object):
+    # Encoded question frames per (quiz_id, quiz version), shared by every
+    # room playing the same quiz
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key, build):
+        frames = self.entries.get(key)
+        if frames is None:
+            frames = build()
+            self.entries[key] = frames
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return frames
@@ -0,0 +1,39 @@
+import hashlib
+from collections import OrderedDict, namedtuple
+from app import app, state
+
+# Serialized quiz snapshots. Every edit bumps the quiz's version in the state
+# store, so a cached entry is never served once the quiz has changed, on any
+# worker, and stale versions simply age out of the LRU.
+
+QuizSnapshot = namedtuple('QuizSnapshot', ['user_id', 'etag', 'body'])
+
+class QuizCache(object):
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, quiz_id, version):
+        key = (quiz_id, version)
+        snapshot = self.entries.get(key)
+        if snapshot is not None:
+            self.entries.move_to_end(key)
+        return snapshot
+
+    def put(self, quiz_id, version, user_id, data):
+        body = (app.json.dumps(data) + '\n').encode()
+        # Strong validator: the hash of the exact bytes we send
+        snapshot = QuizSnapshot(user_id, hashlib.sha1(body).hexdigest(), body)
+        self.entries[(quiz_id, version)] = snapshot
+        self.entries.move_to_end((quiz_id, version))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return snapshot
+
+def quiz_version(quiz_id):
+    return int(state.get('quiz_version:{}'.format(quiz_id)) or 0)
+
+def bump_quiz_version(quiz_id):
+    state.incr('quiz_version:{}'.format(quiz_id))
+
+quiz_cache = QuizCache(app.config['QUIZ_CACHE_SIZE'])
@@ -0,0 +1,48 @@
+from app import state
+
+# Identity of each authenticated socket, keyed by Socket.IO sid. The JWT is
+# verified once at connect; events then only look the sid up here.
+connections = {}
+
+# Number of this worker's sockets bound to each session room
+room_sockets = {}
+
+class Connection(object):
+    __slots__ = ('sid', 'user_id', 'username', 'jti', 'exp', 'session_code', 'participant_id')
+
+    def __init__(self, sid, user_id, username, jti, exp):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.jti = jti
+        self.exp = exp
+        # Bound when the socket joins a session room
+        self.session_code = None
+        self.participant_id = None
+
+    def bind(self, session_code, participant_id):
+        if self.session_code is not None:
+            state.srem(presence_key(self.session_code, self.participant_id), self.sid)
+            remaining = room_sockets.pop(self.session_code) - 1
+            if remaining:
+                room_sockets[self.session_code] = remaining
+        self.session_code = session_code
+        self.participant_id = participant_id
+        if session_code is not None:
+            state.sadd(presence_key(session_code, participant_id), self.sid)
+            room_sockets[session_code] = room_sockets.get(session_code, 0) + 1
+
+def presence_key(session_code, participant_id):
+    # Sids of the participant's sockets in the room, on every worker. A
+    # participant is present while at least one of them is connected.
+    return 'presence:{}:{}'.format(session_code, participant_id)
+
+def is_present(session_code, participant_id):
+    return state.scard(presence_key(session_code, participant_id)) > 0
+
+def restore_presence(session_code):
+    # After the room's presence sets were cleared at quiz end: this worker's
+    # sockets still in the room stay present for a replay
+    for connection in connections.values():
+        if connection.session_code == session_code:
+            state.sadd(presence_key(session_code, connection.participant_id), connection.sid)
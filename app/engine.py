@@ -0,0 +1,52 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+try:
+    from psycogreen.eventlet import patch_psycopg
+except ImportError:
+    patch_psycopg = None
+
+# Engine settings for the DATABASE_PROFILE config value, see config.py
+
+def engine_options(config):
+    # Pool settings for server databases; pre-ping drops connections the
+    # server closed while idle. The pool only bounds how many connections
+    # greenlets share: whether a query lets other greenlets run is up to the
+    # driver (see green_driver).
+    if config['DATABASE_PROFILE'] != 'tuned' or config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True
+    }
+
+def configure_engine(engine, config):
+    if config['DATABASE_PROFILE'] != 'tuned' or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run while the write-behind flush writes, and with
+        # synchronous=NORMAL a commit no longer waits on fsync
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout={}'.format(config['SQLITE_BUSY_TIMEOUT_MS']))
+        cursor.execute('PRAGMA mmap_size={}'.format(config['SQLITE_MMAP_SIZE']))
+        cursor.close()
+
+def green_driver(config, logger):
+    # eventlet's monkey patching reaches drivers that talk through Python
+    # sockets (pymysql, pg8000), but psycopg2 is a C extension and blocks the
+    # whole hub for every query unless psycogreen switches it to green waits
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'postgresql' or url.get_driver_name() != 'psycopg2':
+        return
+    if patch_psycopg is None:
+        logger.warning('psycopg2 is not green under eventlet: install psycogreen, or every query '
+                       'stalls all other games on this worker')
+        return
+    patch_psycopg()
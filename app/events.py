@@ -1,31 +1,80 @@
+from flask import request
 from flask_socketio import join_room, leave_room, send, emit
-from app import socketio, db
-from app.models import Session, Participant, Response, User, Option, Score
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from app import app, socketio, db, state
+from app.models import Session, Participant, User
+from app.game import live_games, start_game, get_game, end_game, host_room
+from app.writebehind import write_behind
+from app.ledger import AnswerLedger
+from app.scheduler import scheduler
+from app.roster import rosters, get_roster, drop_roster, release_roster
+from app.connections import connections, Connection, is_present, restore_presence
+from app.revocation import revocations
+from app.metrics import socket_handler, observe_fanout
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from functools import wraps
 from datetime import datetime
+import time
+
+@socketio.on('connect')
+@socket_handler('connect')
+def handle_connect(auth=None):
+    # Authenticate once per socket; sockets without a valid token may stay
+    # connected but every event from them is rejected
+    try:
+        verify_jwt_in_request()
+    except Exception as e:
+        app.logger.info('Unauthenticated socket: %s', e)
+        return
+    user_id = get_jwt_identity()
+    claims = get_jwt()
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    connections[request.sid] = Connection(request.sid, user_id, user.username, claims['jti'], claims.get('exp'))
+
+@socketio.on('disconnect')
+@socket_handler('disconnect')
+def handle_disconnect():
+    try:
+        connection = connections.pop(request.sid, None)
+        if connection is None or connection.session_code is None:
+            return
+        session_code, participant_id = connection.session_code, connection.participant_id
+        connection.bind(None, None)
+        release_roster(session_code)
+        # Another tab may still be open; otherwise give the player a grace
+        # window to come back before the room stops waiting for them
+        if not is_present(session_code, participant_id) and session_code in live_games:
+            scheduler.schedule(app.config['PRESENCE_GRACE_MS'] / 1000.0, participant_dropped,
+                               session_code, participant_id)
+    except Exception as e:
+        app.logger.error('Error during disconnect: %s', e)
 
 def jwt_required_socketio(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            return f(user_id, *args, **kwargs)
+            connection = connections.get(request.sid)
+            if connection is None:
+                emit('error', {'message': 'Missing or invalid token on connect'})
+                return
+            if connection.exp is not None and connection.exp < time.time():
+                emit('error', {'message': 'Token has expired'})
+                return
+            if revocations.is_revoked(connection.jti):
+                emit('error', {'message': 'Token has been revoked'})
+                return
+            return f(connection.user_id, *args, **kwargs)
         except Exception as e:
             emit('error', {'message': str(e)})
     return decorated_function
 
-# Dictionary to track responses
-response_tracker = {}
-
 @socketio.on('join_session')
+@socket_handler('join_session')
 @jwt_required_socketio
 def handle_join_session(user_id, data):
-    print("join_session event received")
-    print(f"User ID: {user_id}")
-    print(f"Data: {data}")
-    
+    app.logger.debug('join_session from user %s: %s', user_id, data)
+
     session_code = data.get('session_code')
     if session_code is None:
         emit('error', {'message': 'session_code is missing'})
@@ -45,33 +94,33 @@ def handle_join_session(user_id, data):
         emit('error', {'message': 'Session has already started. You cannot join now.'})
         return
 
-    username = User.query.get(user_id).username
-    print(f'{username}: Join room successfully: {session_code}')
+    connection = connections[request.sid]
+    connection.bind(session_code, participant.id)
+    username = connection.username
+    get_roster(session).add(user_id, username)
+    app.logger.debug('%s joined room %s', username, session_code)
     # Join the room
     join_room(session_code)
+    if user_id == session.host_id:
+        join_room(host_room(session_code))
     send(f'{username} has joined the session.', to=session_code)
 
-    # Emit session update
-    participants = Participant.query.filter_by(session_id=session.id).all()
-    participant_usernames = [User.query.get(p.user_id).username for p in participants]
-    emit('session_update', {
-        'host': User.query.get(session.host_id).username,
-        'participants': participant_usernames
-    }, to=session_code)
-
+    # Announce just the newcomer; the full roster follows in a coalesced session_update
+    emit('roster_join', {'username': username}, to=session_code)
+    schedule_session_update(session)
 
 
 @socketio.on('leave_session')
+@socket_handler('leave_session')
 @jwt_required_socketio
 def handle_leave_session(user_id, data):
     session_code = data.get('session_code')
     if session_code is None:
         emit('error', {'message': 'session_code is missing'})
         return
-    username = User.query.get(user_id).username
     
     session = Session.query.filter_by(code=session_code).first()
-    participant = Participant.query.filter_by(session_id=session.id, user_id=user_id).first()
+    participant = session and Participant.query.filter_by(session_id=session.id, user_id=user_id).first()
     
     if not session or not participant:
         emit('error', {'message': 'Session or participant not found'})
@@ -81,48 +130,65 @@ def handle_leave_session(user_id, data):
         # Remove participant from the session
         db.session.delete(participant)
         db.session.commit()
+
+        connection = connections[request.sid]
+        connection.bind(None, None)
+        username = connection.username
+        get_roster(session).remove(user_id)
+        release_roster(session_code)
         
         # Leave the room
         leave_room(session_code)
         send(f'{username} has left the session.', to=session_code)
         
-        # Emit session update
-        participants = Participant.query.filter_by(session_id=session.id).all()
-        participant_usernames = [User.query.get(p.user_id).username for p in participants]
-        emit('session_update', {
-            'host': User.query.get(session.host_id).username,
-            'participants': participant_usernames
-        }, to=session_code)
+        # Announce the departure; the full roster follows in a coalesced session_update
+        emit('roster_leave', {'username': username}, to=session_code)
+        schedule_session_update(session)
     except Exception as e:
         db.session.rollback()
         emit('error', {'message': str(e)})
 
 @socketio.on('quit_session')
+@socket_handler('quit_session')
 @jwt_required_socketio
 def handle_leave_session(user_id, data):
     session_code = data.get('session_code')
     if session_code is None:
         emit('error', {'message': 'session_code is missing'})
         return
-    username = User.query.get(user_id).username
-    
-    session = Session.query.filter_by(code=session_code).first()
-    participant = Participant.query.filter_by(session_id=session.id, user_id=user_id).first()
-    
-    if not session or not participant:
-        emit('error', {'message': 'Session or participant not found'})
-        return
+    connection = connections[request.sid]
+    username = connection.username
+
+    # Sockets that joined this room already know their participant
+    if connection.session_code == session_code:
+        participant_id = connection.participant_id
+    else:
+        session = Session.query.filter_by(code=session_code).first()
+        participant = session and Participant.query.filter_by(session_id=session.id, user_id=user_id).first()
+        
+        if not session or not participant:
+            emit('error', {'message': 'Session or participant not found'})
+            return
+        participant_id = participant.id
     
     try:
         # Leave the room
+        if connection.session_code == session_code:
+            connection.bind(None, None)
+            release_roster(session_code)
         leave_room(session_code)
         send(f'{username} has quitted the session.', to=session_code)
+        # Quitting mid-quiz drops the player right away, without the grace
+        # window a lost connection gets
+        if session_code in live_games:
+            participant_dropped(session_code, participant_id)
     except Exception as e:
         db.session.rollback()
         emit('error', {'message': str(e)})
 
 
 @socketio.on('start_quiz')
+@socket_handler('start_quiz')
 @jwt_required_socketio
 def handle_start_quiz(user_id, data):
     session_code = data.get('session_code')
@@ -139,132 +205,283 @@ def handle_start_quiz(user_id, data):
         emit('error', {'message': 'Only the host can start the session.'})
         return
 
-    session.is_started = True
-    db.session.commit()
-    
-    # Initialize the response tracker
-    response_tracker[session_code] = {
-        'expected_responses': len(session.participants),
-        'received_responses': 0,
-        'current_question_index': 0
-    }
+    # The ledger lives until quiz_end; restarting a running game would
+    # reset the question index under the players' recorded answers
+    ledger = AnswerLedger(session_code)
+    if not ledger.claim():
+        emit('error', {'message': 'The quiz is already running.'})
+        return
+
+    try:
+        session.is_started = True
+        db.session.commit()
+
+        # Load the quiz and roster once; answers are validated against this in memory
+        game = start_game(session)
+
+        # Initialize the response tracker; players who left the lobby without
+        # leaving the session are not waited for
+        absent = [participant_id for participant_id in game.participants.values()
+                  if not is_present(session_code, participant_id)]
+        ledger.start(len(game.participants), absent)
+    except Exception:
+        db.session.rollback()
+        end_game(session_code)
+        ledger.clear({})
+        raise
     
     # Announce to all participants that the quiz has started
     send('The quiz has started!', to=session_code)
     
-    # Send the first question and its options to all participants
-    first_question = session.quiz.questions[0]
-    emit('next_question', {
-        'question_id': first_question.id,
-        'question_text': first_question.text,
-        'total': len(session.quiz.questions),
-        'options': [{'id': option.id, 'text': option.text, 'is_correct': option.is_correct} for option in first_question.options]
-    }, to=session_code)
+    # Send the first question to all participants and the answer key to the host
+    open_question(game, 0)
 
 
 @socketio.on('submit_answer')
+@socket_handler('submit_answer')
 @jwt_required_socketio
 def handle_submit_answer(user_id, data):
     session_code = data.get('session_code')
     if session_code is None:
         emit('error', {'message': 'session_code is missing'})
         return
-    #Get question_id as number
-    question_id = int(data.get('question_id'))
+    question_id = data.get('question_id')
     if question_id is None:
         emit('error', {'message': 'question_id is missing'})
         return
-    option_id = int(data.get('option_id'))
+    option_id = data.get('option_id')
     if option_id is None:
         emit('error', {'message': 'option_id is missing'})
         return
+    question_id = int(question_id)
+    option_id = int(option_id)
 
-    # Find the session and participant
-    session = Session.query.filter_by(code=session_code).first()
-    if not session:
-        emit('error', {'message': 'Session not found'})
+    # The tracker only exists while the quiz is running
+    ledger = AnswerLedger(session_code)
+    current_question_index = ledger.current_question_index
+    if current_question_index is None:
+        emit('error', {'message': 'Session not found or quiz not started'})
         return
 
-    participant = Participant.query.filter_by(session_id=session.id, user_id=user_id).first()
-    if not participant:
-        emit('error', {'message': 'Participant not found'})
+    # Everything needed to validate and score the answer is held in memory
+    game = get_game(session_code)
+    if not game:
+        emit('error', {'message': 'Session not found or quiz not started'})
         return
 
-    # Check if the question_id is the current question
-    current_question_index = response_tracker[session_code]['current_question_index']
-    current_question = session.quiz.questions[current_question_index]
+    participant_id = game.participants.get(user_id)
+    if participant_id is None:
+        emit('error', {'message': 'Participant not found'})
+        return
 
-    if question_id != current_question.id:
-        emit('error', {'message': 'Invalid question_id'})   
+    # Check that the answer belongs to the current question
+    message = game.check_answer(current_question_index, question_id, option_id)
+    if message:
+        emit('error', {'message': message})
         return
 
-    # Check if the option_id is valid for the current question
-    valid_option_ids = [option.id for option in current_question.options]
+    # Time taken to answer, measured on the server from when the question opened
+    elapsed = question_elapsed(game, ledger, current_question_index)
+
+    points = game.points(current_question_index, elapsed) if game.is_correct(question_id, option_id) else 0
 
-    if option_id not in valid_option_ids:
-        emit('error', {'message': 'Invalid option_id'})
+    # Record the answer once per participant and question, adding its option
+    # count and points to the room's shared totals
+    received_responses = ledger.record(question_id, participant_id, option_id, points)
+    if received_responses is None:
+        emit('error', {'message': 'Answer already submitted'})
         return
-    
-    #print(f"User {user_id} submitted answer for question {question_id} with option {option_id}")
-    #print(f"Current question: {valid_option_ids}")
-
-    # Add response to the database
-    response = Response(
-        session_id=session.id,
-        participant_id=participant.id,
-        question_id=question_id,
-        option_id=option_id,
-        response_time=datetime.utcnow()
-    )
-    db.session.add(response)
-    db.session.commit()
+
+    # Queue the response and score; they are written in batches by the write-behind queue
+    write_behind.add_response(game.session_id, participant_id, question_id, option_id, datetime.utcnow())
     
     try:
-        # Calculate the score (implement your scoring logic)
-        correct = Option.query.get(option_id).is_correct
-        if correct:
-            score = Score.query.filter_by(session_id=session.id, participant_id=participant.id).first()
-            if not score:
-                score = Score(session_id=session.id, participant_id=participant.id, score=1)
-            else:
-                score.score += 1
-            db.session.add(score)
-        
-        db.session.commit()
+        if points:
+            write_behind.add_score(game.session_id, participant_id, points)
+            game.leaderboard.add(participant_id, points)
         
-        # Update response tracker
-        response_tracker[session_code]['received_responses'] += 1
-        
-        # Check if all responses are received
-        if response_tracker[session_code]['received_responses'] == response_tracker[session_code]['expected_responses']:
-            # Reset received responses count
-            response_tracker[session_code]['received_responses'] = 0
-            
-            # Move to the next question
-            response_tracker[session_code]['current_question_index'] += 1
-            next_question_index = response_tracker[session_code]['current_question_index']
-            
-            if next_question_index < len(session.quiz.questions):
-                print('Sending next question')
-                next_question = session.quiz.questions[next_question_index]
-                emit('next_question', {
-                    'question_id': next_question.id,
-                    'question_text': next_question.text,
-                    'total': len(session.quiz.questions),
-                    'options': [{'id': option.id, 'text': option.text, 'is_correct': option.is_correct} for option in next_question.options]
-                }, to=session_code)
-            else:
-                # Quiz has ended, emit quiz_end with leaderboard data
-                scores = Score.query.filter_by(session_id=session.id).all()
-                leaderboard = sorted(
-                    [{'username': User.query.get(score.participant.user_id).username, 'score': score.score} for score in scores],
-                    key=lambda x: x['score'], reverse=True
-                )
-                send('The quiz has ended!', to=session_code)
-                emit('quiz_end', {'message': 'The quiz has ended!', 'leaderboard': leaderboard}, to=session_code)
+        # Check if all responses are received; only one submit wins the advance
+        if received_responses >= ledger.expected_responses and ledger.advance(current_question_index):
+            close_question(game, ledger, current_question_index)
         else:
-            emit('answer_received', {'message': 'Answer received!'}, to=session_code)
+            emit('answer_received', {'message': 'Answer received!'})
+            emit('answer_stats', {
+                'question_id': question_id,
+                'received_responses': received_responses,
+                'expected_responses': ledger.expected_responses
+            }, to=host_room(session_code))
     except Exception as e:
         db.session.rollback()
         emit('error', {'message': str(e)})
 
+@socketio.on('resume_session')
+@socket_handler('resume_session')
+@jwt_required_socketio
+def handle_resume_session(user_id, data):
+    # A player reconnecting mid-quiz gets everything needed to redraw the
+    # current question in one event, from the live game and the ledger
+    session_code = data.get('session_code')
+    if session_code is None:
+        emit('error', {'message': 'session_code is missing'})
+        return
+
+    ledger = AnswerLedger(session_code)
+    index = ledger.current_question_index
+    game = index is not None and get_game(session_code)
+    if not game:
+        emit('error', {'message': 'Session not found or quiz not started'})
+        return
+
+    participant_id = game.participants.get(user_id)
+    if participant_id is None:
+        emit('error', {'message': 'Participant not found'})
+        return
+
+    connections[request.sid].bind(session_code, participant_id)
+    join_room(session_code)
+    is_host = user_id == game.host_id
+    if is_host:
+        join_room(host_room(session_code))
+    ledger.restore(participant_id)
+
+    snapshot = {
+        'session_code': session_code,
+        'index': index,
+        'total': game.total,
+        'score': ledger.score(participant_id)
+    }
+    if index < game.total:
+        question_id = game.question_ids[index]
+        snapshot['question'] = game.question_payload(index, host=is_host)
+        if is_host:
+            snapshot['expected_responses'] = ledger.expected_responses
+        snapshot['answered'] = ledger.has_answered(question_id, participant_id)
+        snapshot['remaining_time'] = max(0, game.time_limit(index) - question_elapsed(game, ledger, index))
+    emit('session_resumed', snapshot)
+
+def question_elapsed(game, ledger, index):
+    # Seconds since the question opened, by this process's clock if it opened
+    # it and by the ledger's wall-clock time otherwise
+    elapsed = game.elapsed(index)
+    if elapsed is None:
+        opened_at = ledger.opened_at(index)
+        elapsed = time.time() - opened_at if opened_at is not None else game.time_limit(index)
+    return elapsed
+
+def participant_dropped(session_code, participant_id):
+    # Grace window over; stop waiting for the player unless they came back
+    if is_present(session_code, participant_id):
+        return
+    game = live_games.get(session_code)
+    ledger = AnswerLedger(session_code)
+    index = ledger.current_question_index
+    if game is None or index is None or index >= game.total:
+        return
+    question_id = game.question_ids[index]
+    if not ledger.drop(participant_id, question_id):
+        return
+    # Everyone still connected may already have answered
+    received_responses = ledger.received(question_id)
+    if received_responses >= ledger.expected_responses and ledger.advance(index):
+        close_question(game, ledger, index)
+    else:
+        socketio.emit('answer_stats', {
+            'question_id': question_id,
+            'received_responses': received_responses,
+            'expected_responses': ledger.expected_responses
+        }, to=host_room(session_code))
+
+def open_question(game, index):
+    session_code = game.session_code
+    socketio.emit('next_question', game.player_frames[index], to=session_code)
+    observe_fanout('next_question', session_code)
+    socketio.emit('host_question', game.host_frames[index], to=host_room(session_code))
+    game.mark_opened(index)
+    ledger = AnswerLedger(session_code)
+    ledger.mark_opened(index)
+    # The host frame is shared across rooms; this room's head count goes separately
+    socketio.emit('answer_stats', {
+        'question_id': game.question_ids[index],
+        'received_responses': 0,
+        'expected_responses': ledger.expected_responses
+    }, to=host_room(session_code))
+    # The question closes on its own once the time limit passes
+    game.timer = scheduler.schedule(game.time_limit(index), question_timeout, session_code, index)
+
+def question_timeout(session_code, index):
+    game = get_game(session_code)
+    ledger = AnswerLedger(session_code)
+    # Loses to the last answer if everyone got in before the deadline
+    if game is None or not ledger.advance(index):
+        return
+    close_question(game, ledger, index)
+
+def close_question(game, ledger, index):
+    # Called once per question by whoever won ledger.advance(index)
+    scheduler.cancel(game.timer)
+    game.timer = None
+    session_code = game.session_code
+    question_id = game.question_ids[index]
+    # Record a no-answer for everyone who did not respond: all the stragglers
+    # on a timeout, only dropped players otherwise
+    answered = ledger.answered(question_id)
+    if len(answered) < len(game.participants):
+        response_time = datetime.utcnow()
+        for participant_id in game.participants.values():
+            if participant_id not in answered:
+                write_behind.add_response(game.session_id, participant_id, question_id, None, response_time)
+    socketio.emit('question_result', {
+        'question_id': question_id,
+        'correct_option_ids': game.correct_options[question_id],
+        'option_counts': ledger.option_counts(question_id, game.options[question_id])
+    }, to=session_code)
+
+    if state.shared:
+        # Answers may have been scored on other workers. Apply the totals that
+        # changed on each question since this process last ranked the room.
+        for scored_index in range(game.scored_index + 1, index + 1):
+            game.leaderboard.update(ledger.changed_totals(game.question_ids[scored_index]))
+        game.scored_index = index
+
+    next_question_index = index + 1
+    if next_question_index < game.total:
+        socketio.emit('leaderboard_update', {
+            'leaderboard': game.leaderboard.top(app.config['LEADERBOARD_TOP_K'])
+        }, to=session_code)
+        open_question(game, next_question_index)
+    else:
+        # Quiz has ended, write out every queued answer so the scores are
+        # persisted. The board comes from the ledger, so players get it even
+        # if the database write fails; the queue retries it later.
+        try:
+            write_behind.flush()
+        except Exception as e:
+            app.logger.error('Write-behind flush at quiz end failed: %s', e)
+        leaderboard = game.leaderboard.top()
+        end_game(session_code)
+        drop_roster(session_code)
+        ledger.clear(game.options, game.participants.values())
+        restore_presence(session_code)
+        socketio.send('The quiz has ended!', to=session_code)
+        socketio.emit('quiz_end', {'message': 'The quiz has ended!', 'leaderboard': leaderboard}, to=session_code)
+
+# Rooms with a full session_update already scheduled
+pending_session_updates = set()
+
+def schedule_session_update(session):
+    # At most one full roster broadcast per room every SESSION_UPDATE_INTERVAL_MS
+    if session.code in pending_session_updates:
+        return
+    pending_session_updates.add(session.code)
+    scheduler.schedule(app.config['SESSION_UPDATE_INTERVAL_MS'] / 1000.0, send_session_update, session.code)
+
+def send_session_update(session_code):
+    pending_session_updates.discard(session_code)
+    roster = rosters.get(session_code)
+    if roster is None:
+        return
+    if state.shared:
+        # Players may have joined through other workers
+        roster.load()
+    socketio.emit('session_update', roster.payload(), to=session_code)
+    observe_fanout('session_update', session_code)
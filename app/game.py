@@ -0,0 +1,145 @@
+import time
+from sqlalchemy.orm import selectinload
+from app import app, db
+from app.models import Session, Participant, Question, User
+from app.leaderboard import Leaderboard
+from app.broadcast import FrameCache, pre_encode
+from app.cache import quiz_version
+
+# Live games keyed by session code, built once when the host starts the quiz
+live_games = {}
+# Encoded next_question frames, reused by every room playing the same quiz version
+question_frames = FrameCache(app.config['QUESTION_FRAME_CACHE_SIZE'])
+
+class LiveGame(object):
+    def __init__(self, session):
+        self.session_id = session.id
+        self.session_code = session.code
+        self.quiz_id = session.quiz_id
+        self.host_id = session.host_id
+        # Scheduler timer closing the current question
+        self.timer = None
+        # Index and monotonic time of the last question this process opened
+        self.opened_index = None
+        self.opened_at = None
+        # Last question whose shared score totals are in self.leaderboard
+        self.scored_index = -1
+        self.quiz_version = quiz_version(session.quiz_id)
+
+        questions = Question.query.filter_by(quiz_id=session.quiz_id) \
+            .options(selectinload(Question.options)) \
+            .order_by(Question.id).all()
+        # Ordered question ids and the data needed to announce each question
+        self.question_ids = [question.id for question in questions]
+        self.questions = {
+            question.id: {
+                'text': question.text,
+                'time_limit': question.time_limit,
+                'options': [(option.id, option.text, option.is_correct) for option in question.options]
+            } for question in questions
+        }
+        # question_id -> {option_id: is_correct}
+        self.options = {
+            question.id: {option.id: option.is_correct for option in question.options}
+            for question in questions
+        }
+        self.correct_options = {
+            question_id: [option_id for option_id, is_correct in options.items() if is_correct]
+            for question_id, options in self.options.items()
+        }
+        # user_id -> participant_id, with usernames cached for the leaderboard
+        rows = db.session.query(Participant.user_id, Participant.id, User.username) \
+            .join(User, User.id == Participant.user_id) \
+            .filter(Participant.session_id == session.id).all()
+        self.participants = {}
+        self.leaderboard = Leaderboard()
+        for user_id, participant_id, username in rows:
+            self.participants[user_id] = participant_id
+            self.leaderboard.add_participant(participant_id, username)
+
+        # Every question's broadcast payloads, encoded once: the player view
+        # without correctness and the host view with it. They are shared with
+        # other rooms playing the quiz, so nothing about this session goes in.
+        self.player_frames, self.host_frames = question_frames.get((self.quiz_id, self.quiz_version), lambda: (
+            [pre_encode(self.question_payload(index)) for index in range(self.total)],
+            [pre_encode(self.question_payload(index, host=True)) for index in range(self.total)]
+        ))
+
+    @property
+    def total(self):
+        return len(self.question_ids)
+
+    def question_payload(self, index, host=False):
+        question_id = self.question_ids[index]
+        question = self.questions[question_id]
+        if host:
+            options = [{'id': option_id, 'text': text, 'is_correct': is_correct}
+                       for option_id, text, is_correct in question['options']]
+        else:
+            options = [{'id': option_id, 'text': text} for option_id, text, _ in question['options']]
+        payload = {
+            'question_id': question_id,
+            'question_text': question['text'],
+            'time_limit': question['time_limit'],
+            'total': self.total,
+            'options': options
+        }
+        if host:
+            payload['index'] = index
+        return payload
+
+    def check_answer(self, index, question_id, option_id):
+        # Returns None if the answer is valid for the current question,
+        # otherwise the error message to send back
+        if index >= self.total:
+            return 'The quiz has ended'
+        if question_id != self.question_ids[index]:
+            return 'Invalid question_id'
+        if option_id not in self.options[question_id]:
+            return 'Invalid option_id'
+        return None
+
+    def is_correct(self, question_id, option_id):
+        return self.options[question_id][option_id]
+
+    def time_limit(self, index):
+        return self.questions[self.question_ids[index]]['time_limit']
+
+    def mark_opened(self, index):
+        self.opened_index = index
+        self.opened_at = time.monotonic()
+
+    def elapsed(self, index):
+        # Seconds since this process opened the question, or None if another
+        # worker opened it
+        if self.opened_index != index:
+            return None
+        return time.monotonic() - self.opened_at
+
+    def points(self, index, elapsed):
+        # Kahoot-style: a correct answer is worth between half and all of
+        # QUESTION_POINTS depending on how fast it came in
+        time_limit = self.time_limit(index)
+        elapsed = min(max(elapsed, 0), time_limit)
+        return int(round(app.config['QUESTION_POINTS'] * (1 - elapsed / time_limit / 2)))
+
+def host_room(session_code):
+    # The host's sockets also join this room to get correctness and answer stats
+    return '{}:host'.format(session_code)
+
+def start_game(session):
+    game = LiveGame(session)
+    live_games[session.code] = game
+    return game
+
+def get_game(session_code):
+    game = live_games.get(session_code)
+    if game is None:
+        # The quiz may have been started on another worker; build our own copy
+        session = Session.query.filter_by(code=session_code).first()
+        if session and session.is_started:
+            game = start_game(session)
+    return game
+
+def end_game(session_code):
+    live_games.pop(session_code, None)
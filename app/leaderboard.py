@@ -0,0 +1,47 @@
+from bisect import bisect_left, insort
+
+class Leaderboard(object):
+    # Ranking kept sorted as scores change. Entries are (-score, participant_id)
+    # tuples so the best score comes first and ties keep a stable order. An
+    # update finds the entry by binary search, but removing and reinserting
+    # it shifts the list, so it is O(n): one memmove of n pointers, which
+    # stays in the microseconds for room sizes this server handles and needs
+    # no tree structure. It never re-sorts the whole board.
+
+    def __init__(self):
+        self.scores = {}
+        self.usernames = {}
+        self.ranked = []
+
+    def add_participant(self, participant_id, username, score=0):
+        if participant_id in self.scores:
+            return
+        self.scores[participant_id] = score
+        self.usernames[participant_id] = username
+        insort(self.ranked, (-score, participant_id))
+
+    def add(self, participant_id, points):
+        return self.set(participant_id, self.scores[participant_id] + points)
+
+    def set(self, participant_id, score):
+        old = self.scores[participant_id]
+        if score != old:
+            del self.ranked[bisect_left(self.ranked, (-old, participant_id))]
+            insort(self.ranked, (-score, participant_id))
+            self.scores[participant_id] = score
+        return score
+
+    def update(self, totals):
+        # Applies new totals (participant_id -> score) for just the players
+        # whose score changed, e.g. from answers scored on other workers
+        for participant_id, score in totals.items():
+            if participant_id in self.scores:
+                self.set(participant_id, score)
+
+    def score(self, participant_id):
+        return self.scores.get(participant_id, 0)
+
+    def top(self, k=None):
+        entries = self.ranked if k is None else self.ranked[:k]
+        return [{'username': self.usernames[participant_id], 'score': -score}
+                for score, participant_id in entries]
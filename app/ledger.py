@@ -0,0 +1,141 @@
+import time
+from app import state
+from app.connections import presence_key
+
+class AnswerLedger(object):
+    # Per-session answer bookkeeping in the shared state store. Each
+    # (question_id, participant_id) pair is recorded once, and moving from one
+    # question to the next is a compare-and-set on the question index, so
+    # concurrent submits on any worker advance the room exactly once.
+
+    def __init__(self, session_code):
+        self.session_code = session_code
+
+    def key(self, field):
+        return 'tracker:{}:{}'.format(self.session_code, field)
+
+    def answers_key(self, question_id):
+        return 'tracker:{}:answers:{}'.format(self.session_code, question_id)
+
+    def claim(self):
+        # Puts the room on question 0. Returns False if a game is already
+        # running, so only one of several start_quiz calls gets to start it.
+        return state.setnx(self.key('current_question_index'), 0)
+
+    def start(self, expected_responses, absent=()):
+        # After claim(). Participants already gone when the quiz starts are
+        # not waited for until resume_session restores them.
+        for participant_id in absent:
+            state.sadd(self.key('dropped'), participant_id)
+        state.set(self.key('expected_responses'), expected_responses - len(absent))
+
+    @property
+    def current_question_index(self):
+        index = state.get(self.key('current_question_index'))
+        return None if index is None else int(index)
+
+    def mark_opened(self, index):
+        # Wall-clock open time, for workers that did not open the question themselves
+        state.set(self.key('opened_at'), '{}:{}'.format(index, time.time()))
+
+    def opened_at(self, index):
+        value = state.get(self.key('opened_at'))
+        if value is None:
+            return None
+        opened_index, opened_at = value.split(':')
+        return float(opened_at) if int(opened_index) == index else None
+
+    @property
+    def expected_responses(self):
+        return int(state.get(self.key('expected_responses')) or 0)
+
+    def record(self, question_id, participant_id, option_id=None, points=0):
+        # Returns the number of distinct answers for the question, or None if
+        # this participant had already answered it. The answer is counted
+        # only once its option count and points are in, so whoever sees the
+        # last answer also sees every option count and score.
+        if not state.sadd(self.answers_key(question_id), participant_id):
+            return None
+        if option_id is not None:
+            state.incr(self.option_key(question_id, option_id))
+        if points:
+            total = state.hincr(self.key('scores'), participant_id, points)
+            state.hset(self.totals_key(question_id), participant_id, total)
+        return state.incr(self.received_key(question_id))
+
+    def received_key(self, question_id):
+        return 'tracker:{}:received:{}'.format(self.session_code, question_id)
+
+    def totals_key(self, question_id):
+        return 'tracker:{}:totals:{}'.format(self.session_code, question_id)
+
+    def changed_totals(self, question_id):
+        # participant_id -> total points, for the players who scored on the
+        # question, across every worker
+        return {int(participant_id): int(score)
+                for participant_id, score in state.hgetall(self.totals_key(question_id)).items()}
+
+    def score(self, participant_id):
+        return int(state.hget(self.key('scores'), participant_id) or 0)
+
+    def has_answered(self, question_id, participant_id):
+        return state.sismember(self.answers_key(question_id), participant_id)
+
+    def received(self, question_id):
+        return int(state.get(self.received_key(question_id)) or 0)
+
+    def answered(self, question_id):
+        # Participant ids that answered the question
+        return {int(participant_id) for participant_id in state.smembers(self.answers_key(question_id))}
+
+    def option_counts(self, question_id, option_ids):
+        return {option_id: int(state.get(self.option_key(question_id, option_id)) or 0)
+                for option_id in option_ids}
+
+    def option_key(self, question_id, option_id):
+        return 'tracker:{}:option:{}:{}'.format(self.session_code, question_id, option_id)
+
+    def advance(self, from_index):
+        # Only the caller that moves the index off from_index gets True
+        if not state.compare_and_set(self.key('current_question_index'), from_index, from_index + 1):
+            return False
+        # Players who dropped after answering the closed question stop being
+        # expected from this one on
+        dropping = state.smembers(self.key('dropping'))
+        if dropping:
+            state.delete(self.key('dropping'))
+            state.incr(self.key('expected_responses'), -len(dropping))
+        return True
+
+    def drop(self, participant_id, question_id):
+        # A disconnected player no longer holds up the room. Returns True if
+        # they were still expected.
+        if not state.sadd(self.key('dropped'), participant_id):
+            return False
+        if self.has_answered(question_id, participant_id):
+            # Their answer already counts towards this question
+            state.sadd(self.key('dropping'), participant_id)
+        else:
+            state.incr(self.key('expected_responses'), -1)
+        return True
+
+    def restore(self, participant_id):
+        # Undoes drop() for a player who came back
+        if not state.srem(self.key('dropped'), participant_id):
+            return False
+        if not state.srem(self.key('dropping'), participant_id):
+            state.incr(self.key('expected_responses'))
+        return True
+
+    def clear(self, options, participant_ids=()):
+        # options is LiveGame.options: question_id -> {option_id: is_correct}.
+        # The players' presence sets go too, so no key of the room outlives it.
+        keys = [self.key('expected_responses'), self.key('current_question_index'), self.key('opened_at'),
+                self.key('dropped'), self.key('dropping'), self.key('scores')]
+        for question_id, option_ids in options.items():
+            keys.append(self.answers_key(question_id))
+            keys.append(self.received_key(question_id))
+            keys.append(self.totals_key(question_id))
+            keys.extend(self.option_key(question_id, option_id) for option_id in option_ids)
+        keys.extend(presence_key(self.session_code, participant_id) for participant_id in participant_ids)
+        state.delete(*keys)
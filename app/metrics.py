@@ -0,0 +1,169 @@
+import random
+import time
+from functools import wraps
+from flask import g, request, Response
+from app import app, socketio
+from app.game import live_games
+from app.connections import connections
+from app.profiler import sql_profiler
+from app.utils import observe_statements, unobserve_statements
+
+# Prometheus text-format metrics for the socket handlers and REST routes,
+# served at /metrics. Call counts are exact. Latency, DB time and fan-out are
+# only measured for a METRICS_SAMPLE_RATE fraction of calls, so an unsampled
+# call costs a counter increment and one random().
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+FANOUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0) + 1
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name + format_labels(self.labels, label_values), value
+
+class Gauge(object):
+    # Read from a callback when /metrics is scraped
+    type = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        yield self.name, self.read()
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [per-bucket counts, sum, count]
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * len(self.buckets), 0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        names = self.labels + ('le',)
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket' + format_labels(names, label_values + (bound,)), cumulative
+            yield self.name + '_bucket' + format_labels(names, label_values + ('+Inf',)), count
+            yield self.name + '_sum' + format_labels(self.labels, label_values), total
+            yield self.name + '_count' + format_labels(self.labels, label_values), count
+
+handler_calls = Counter('kahoot_handler_calls_total', 'Socket.IO events and HTTP requests handled',
+                        ('kind', 'handler'))
+handler_latency = Histogram('kahoot_handler_latency_seconds', 'Handler latency (sampled)',
+                            LATENCY_BUCKETS, ('kind', 'handler'))
+handler_queries = Histogram('kahoot_handler_db_queries', 'SQL statements per handler call (sampled)',
+                            QUERY_BUCKETS, ('kind', 'handler'))
+handler_db_time = Histogram('kahoot_handler_db_seconds', 'Time spent in SQL per handler call (sampled)',
+                            LATENCY_BUCKETS, ('kind', 'handler'))
+emit_fanout = Histogram('kahoot_emit_fanout', 'Local sockets reached by a room broadcast (sampled)',
+                        FANOUT_BUCKETS, ('event',))
+metrics = [
+    handler_calls, handler_latency, handler_queries, handler_db_time, emit_fanout,
+    Gauge('kahoot_live_rooms', 'Games in progress on this worker', lambda: len(live_games)),
+    Gauge('kahoot_connected_sockets', 'Authenticated sockets on this worker', lambda: len(connections))
+]
+
+def sampled():
+    rate = app.config['METRICS_SAMPLE_RATE']
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+def start_sample():
+    # [statements, seconds in SQL], filled in by count_statement
+    g.metrics_sample = [0, 0.0]
+    observe_statements(count_statement)
+    return time.perf_counter()
+
+def count_statement(statement, seconds):
+    sample = g.metrics_sample
+    sample[0] += 1
+    sample[1] += seconds
+
+def finish_sample(kind, handler, started):
+    latency = time.perf_counter() - started
+    unobserve_statements(count_statement)
+    queries, db_time = g.pop('metrics_sample')
+    handler_latency.observe(latency, kind, handler)
+    handler_queries.observe(queries, kind, handler)
+    handler_db_time.observe(db_time, kind, handler)
+
+def socket_handler(event_name):
+    # Wraps a Socket.IO handler, outside jwt_required_socketio so rejected
+    # calls are counted too. Also feeds the SQL profiler when it is on.
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            handler_calls.inc('socket', event_name)
+            profiling = sql_profiler.enabled and sql_profiler.start()
+            started = start_sample() if sampled() else None
+            try:
+                return f(*args, **kwargs)
+            finally:
+                if started is not None:
+                    finish_sample('socket', event_name, started)
+                if profiling:
+                    sql_profiler.finish('socket', event_name)
+        return wrapped
+    return decorator
+
+def observe_fanout(event_name, room):
+    if sampled():
+        emit_fanout.observe(sum(1 for _ in socketio.server.manager.get_participants('/', room)), event_name)
+
+@app.before_request
+def start_request_sample():
+    handler_calls.inc('http', request.endpoint or 'unmatched')
+    if sampled():
+        g.metrics_started = start_sample()
+
+@app.teardown_request
+def finish_request_sample(exc):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        finish_sample('http', request.endpoint or 'unmatched', started)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    lines = []
+    for metric in metrics:
+        lines.append('# HELP {} {}'.format(metric.name, metric.help))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        for name, value in metric.samples():
+            lines.append('{} {}'.format(name, value))
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
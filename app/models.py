@@ -1,5 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
@@ -56,6 +58,22 @@ class Quiz(db.Model):
     # becomes orphaned (i.e., it is no longer associated with a parent Quiz or Question), it is automatically deleted 
     # from the database
     questions = db.relationship('Question', back_populates='quiz', cascade='all, delete-orphan')
+    # Serves the per-user listing ordered by (created_at, id)
+    __table_args__ = (db.Index('ix_quiz_user_id_created_at', 'user_id', 'created_at'),)
+
+    @classmethod
+    def query_with_tree(cls):
+        # Loads the questions and options of every matched quiz in two extra
+        # queries, however many quizzes or questions there are, so to_dict()
+        # never lazy-loads
+        return cls.query.options(selectinload(cls.questions).selectinload(Question.options))
+
+    @classmethod
+    def query_summary(cls):
+        # id, title, created_at and the question count, without loading any Question rows
+        question_count = db.select(func.count(Question.id)) \
+            .where(Question.quiz_id == cls.id).correlate(cls).scalar_subquery()
+        return db.session.query(cls.id, cls.title, cls.created_at, question_count.label('question_count'))
 
     def to_dict(self):
         return {
@@ -95,7 +113,6 @@ class Quiz(db.Model):
                     # question id must be valid (exist)
                     else:
                         if question_id not in existing_question_ids:
-                            print("raise exception")
                             raise ValueError('Question id is invalid.')
                         existing_question_ids[question_id].from_dict(question_data, self)
         return self
@@ -104,6 +121,8 @@ class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
+    # Seconds players have to answer before the question closes on its own
+    time_limit = db.Column(db.Integer, default=20, server_default='20', nullable=False)
     # type = db.Column(db.String(32), nullable=False, default='multiple_choice')
     quiz = db.relationship('Quiz', back_populates='questions')
     options = db.relationship('Option', back_populates='question', cascade='all, delete-orphan')
@@ -113,6 +132,7 @@ class Question(db.Model):
             'id': self.id,
             'quiz_id': self.quiz_id,
             'text': self.text,
+            'time_limit': self.time_limit,
             'options': [option.to_dict() for option in self.options]
         }
     
@@ -125,6 +145,7 @@ class Question(db.Model):
             if data["options"] == []:
                 raise ValueError('At least 1 option is required')
             setattr(self, "text", data["text"])
+            self.set_time_limit(data)
             if quiz:
                 self.quiz = quiz
             for option_data in data['options']:
@@ -134,6 +155,7 @@ class Question(db.Model):
         else:
             if "text" in data:
                 setattr(self, "text", data["text"])
+            self.set_time_limit(data)
             if 'options' in data:
                 existing_option_ids = {option.id: option for option in self.options}
                 for option_data in data['options']:
@@ -149,6 +171,16 @@ class Question(db.Model):
                         existing_option_ids[option_id].from_dict(option_data, self)
         return self
 
+    def set_time_limit(self, data):
+        if "time_limit" in data:
+            setattr(self, "time_limit", Question.check_time_limit(data["time_limit"]))
+
+    @staticmethod
+    def check_time_limit(time_limit):
+        if not isinstance(time_limit, int) or isinstance(time_limit, bool) or time_limit < 1:
+            raise ValueError('Question time_limit must be a positive number of seconds')
+        return time_limit
+
 class Option(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
@@ -198,6 +230,8 @@ class Participant(db.Model):
     join_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     session = db.relationship('Session', back_populates='participants')
     user = db.relationship('User')
+    # Looked up by (session_id, user_id) on every socket event; a user joins a session once
+    __table_args__ = (db.Index('ix_participant_session_id_user_id', 'session_id', 'user_id', unique=True),)
 
 class Response(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -210,6 +244,7 @@ class Response(db.Model):
     participant = db.relationship('Participant')
     question = db.relationship('Question')
     option = db.relationship('Option')
+    __table_args__ = (db.Index('ix_response_session_id_question_id', 'session_id', 'question_id'),)
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -218,6 +253,13 @@ class Score(db.Model):
     score = db.Column(db.Integer, nullable=False)
     session = db.relationship('Session')
     participant = db.relationship('Participant')
+    # One running total per participant, upserted by the write-behind queue
+    __table_args__ = (db.Index('ix_score_session_id_participant_id', 'session_id', 'participant_id', unique=True),)
+
+class RevokedToken(db.Model):
+    # Logged-out access tokens, kept until they would have expired anyway
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
 # class Category(db.Model):
 #     id = db.Column(db.Integer, primary_key=True)
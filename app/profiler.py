@@ -0,0 +1,114 @@
+import atexit
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request
+from app import app
+from app.utils import count_queries, observe_statements, unobserve_statements
+
+# Development-only SQL profiler, switched on with SQL_PROFILE=1. Records the
+# statements each Socket.IO event and HTTP request runs, warns when one goes
+# over SQL_QUERY_BUDGET or repeats a statement (the usual sign of an N+1),
+# and prints a per-handler report when the process exits.
+
+class HandlerProfile(object):
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.duplicates = 0
+        self.db_time = 0.0
+        self.over_budget = 0
+        # Most repeated statement seen in a single call, with its count
+        self.worst_duplicate = (None, 0)
+
+class SQLProfiler(object):
+    def __init__(self, budget):
+        self.budget = budget
+        self.enabled = False
+        self.profiles = {}
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        atexit.register(self.report)
+
+    def start(self):
+        # [(statement, seconds)] for the handler running in this context
+        g.sql_profile = []
+        observe_statements(self.record)
+        return True
+
+    def record(self, statement, seconds):
+        g.sql_profile.append((statement, seconds))
+
+    def finish(self, kind, handler):
+        unobserve_statements(self.record)
+        statements = g.pop('sql_profile', None)
+        if statements is None:
+            return
+        key = (kind, handler)
+        profile = self.profiles.get(key)
+        if profile is None:
+            profile = self.profiles[key] = HandlerProfile()
+        repeated = Counter(statement for statement, _ in statements)
+        duplicates = sum(count - 1 for count in repeated.values())
+        profile.calls += 1
+        profile.statements += len(statements)
+        profile.max_statements = max(profile.max_statements, len(statements))
+        profile.duplicates += duplicates
+        profile.db_time += sum(seconds for _, seconds in statements)
+        if duplicates:
+            statement, count = repeated.most_common(1)[0]
+            if count > profile.worst_duplicate[1]:
+                profile.worst_duplicate = (statement, count)
+        if len(statements) > self.budget:
+            profile.over_budget += 1
+            app.logger.warning('%s %s ran %d SQL statements (budget %d), %d duplicated',
+                               kind, handler, len(statements), self.budget, duplicates)
+
+    def report(self, out=None):
+        out = out or sys.stderr
+        if not self.profiles:
+            return
+        out.write('SQL profile (budget {} statements per call)\n'.format(self.budget))
+        out.write('{:<6} {:<28} {:>7} {:>9} {:>5} {:>6} {:>10} {:>6}\n'.format(
+            'kind', 'handler', 'calls', 'stmt/call', 'max', 'dupes', 'db ms/call', 'over'))
+        ranked = sorted(self.profiles.items(), key=lambda item: item[1].statements / item[1].calls, reverse=True)
+        for (kind, handler), profile in ranked:
+            out.write('{:<6} {:<28} {:>7} {:>9.1f} {:>5} {:>6} {:>10.2f} {:>6}\n'.format(
+                kind, handler, profile.calls, profile.statements / profile.calls, profile.max_statements,
+                profile.duplicates, profile.db_time / profile.calls * 1000, profile.over_budget))
+        for (kind, handler), profile in ranked:
+            statement, count = profile.worst_duplicate
+            if statement is not None:
+                out.write('{} {}: {}x {}\n'.format(kind, handler, count, ' '.join(statement.split())))
+
+sql_profiler = SQLProfiler(app.config['SQL_QUERY_BUDGET'])
+
+if app.config['SQL_PROFILE']:
+    sql_profiler.enable()
+
+    @app.before_request
+    def start_request_profile():
+        sql_profiler.start()
+
+    @app.teardown_request
+    def finish_request_profile(exc):
+        sql_profiler.finish('http', request.endpoint or 'unmatched')
+
+@contextmanager
+def query_budget(max_statements, allow_duplicates=False):
+    # Fails the block if it runs more than max_statements statements, or
+    # repeats one unless allow_duplicates, e.g.
+    #     with query_budget(3):
+    #         client.get('/quiz/all')
+    # Tests get it as the query_budget fixture from tests/conftest.py.
+    with app.app_context(), count_queries() as statements:
+        yield statements
+    assert len(statements) <= max_statements, \
+        'ran {} SQL statements, budget is {}:\n{}'.format(len(statements), max_statements, '\n'.join(statements))
+    if not allow_duplicates:
+        repeated = [statement for statement, count in Counter(statements).items() if count > 1]
+        assert not repeated, 'repeated SQL statements:\n{}'.format('\n'.join(repeated))
@@ -0,0 +1,223 @@
+from sqlalchemy import delete, exists, literal, or_, select, union_all, update
+from app import db
+from app.models import Quiz, Question, Option
+from app.utils import insert_ids
+
+# Body of PATCH /quiz/<id>: only what changed, e.g.
+#     {"title": "New title",
+#      "questions": {"add": [{"text": "...", "time_limit": 30,
+#                             "options": [{"text": "...", "is_correct": true}]}],
+#                    "update": [{"id": 4, "text": "..."}],
+#                    "remove": [7]},
+#      "options": {"add": [{"question_id": 4, "text": "...", "is_correct": false}],
+#                  "update": [{"id": 12, "is_correct": true}],
+#                  "remove": [13]}}
+# Every part is optional. The diff is applied with one bulk statement per kind
+# of change, so the cost follows the size of the edit, not of the quiz.
+
+QUESTION_FIELDS = ('text', 'time_limit')
+OPTION_FIELDS = ('text', 'is_correct')
+
+class QuizDiff(object):
+    def __init__(self, data):
+        if not isinstance(data, dict) or not data:
+            raise ValueError('No data provided')
+        self.title = data.get('title')
+        if 'title' in data and (not isinstance(self.title, str) or not self.title):
+            raise ValueError('Title is required')
+        questions = section(data, 'questions')
+        options = section(data, 'options')
+        self.added_questions = [new_question(question) for question in questions.get('add', [])]
+        self.updated_questions = [changes(question, QUESTION_FIELDS, 'Question')
+                                  for question in questions.get('update', [])]
+        self.removed_questions = ids(questions.get('remove', []), 'Question')
+        self.added_options = [new_option(option, standalone=True) for option in options.get('add', [])]
+        self.updated_options = [changes(option, OPTION_FIELDS, 'Option') for option in options.get('update', [])]
+        self.removed_options = ids(options.get('remove', []), 'Option')
+
+        removed_questions = set(self.removed_questions)
+        if any(question['id'] in removed_questions for question in self.updated_questions) or \
+                any(option['question_id'] in removed_questions for option in self.added_options):
+            raise ValueError('Question id is invalid.')
+        if set(option['id'] for option in self.updated_options) & set(self.removed_options):
+            raise ValueError('Option id is invalid.')
+
+    def question_ids(self):
+        return {question['id'] for question in self.updated_questions} | set(self.removed_questions) | \
+            {option['question_id'] for option in self.added_options}
+
+    def option_ids(self):
+        return {option['id'] for option in self.updated_options} | set(self.removed_options)
+
+    def load(self, quiz_id):
+        # One query for the quiz owner and whichever of the referenced question
+        # and option ids belong to this quiz. Returns the owner's user id, or
+        # None if there is no such quiz.
+        question_ids = self.question_ids()
+        option_ids = self.option_ids()
+        parts = [select(literal('quiz'), Quiz.user_id, Quiz.id).where(Quiz.id == quiz_id)]
+        if question_ids:
+            parts.append(select(literal('question'), Question.id, Question.quiz_id)
+                         .where(Question.quiz_id == quiz_id, Question.id.in_(question_ids)))
+        if option_ids:
+            parts.append(select(literal('option'), Option.id, Option.question_id)
+                         .join(Question, Question.id == Option.question_id)
+                         .where(Question.quiz_id == quiz_id, Option.id.in_(option_ids)))
+        owner_id = None
+        found = {'question': set(), 'option': set()}
+        removed_options = set(self.removed_options)
+        # Questions losing options, checked again by check_result()
+        self.thinned_questions = set()
+        for kind, value, parent_id in db.session.execute(union_all(*parts)):
+            if kind == 'quiz':
+                owner_id = value
+                continue
+            found[kind].add(value)
+            if kind == 'option' and value in removed_options:
+                self.thinned_questions.add(parent_id)
+        self.missing_questions = question_ids - found['question']
+        self.missing_options = option_ids - found['option']
+        return owner_id
+
+    def check_references(self):
+        # After load(): every id in the diff must belong to the quiz
+        if self.missing_questions:
+            raise ValueError('Question id is invalid.')
+        if self.missing_options:
+            raise ValueError('Option id is invalid.')
+
+    def check_result(self, quiz_id):
+        # After apply(), before commit: removals must leave the quiz within
+        # the /create/quiz rules, or it could no longer be started
+        if not (self.removed_questions or self.removed_options):
+            return
+        if self.removed_questions and \
+                db.session.execute(select(Question.id).where(Question.quiz_id == quiz_id).limit(1)).first() is None:
+            raise ValueError('At least 1 question is required')
+        thinned = self.thinned_questions - set(self.removed_questions)
+        if thinned and db.session.execute(
+                select(Question.id).where(Question.id.in_(thinned),
+                                          ~exists().where(Option.question_id == Question.id)).limit(1)).first():
+            raise ValueError('At least 1 option is required')
+
+    def apply(self, quiz_id):
+        # Returns the changed fragments, in the shape of Quiz.to_dict()
+        session = db.session
+        bulk = {'synchronize_session': False}
+        result = {'id': quiz_id}
+        if self.title is not None:
+            session.execute(update(Quiz).where(Quiz.id == quiz_id).values(title=self.title),
+                            execution_options=bulk)
+            result['title'] = self.title
+
+        # Options first; bulk deletes skip the ORM's delete-orphan cascade
+        if self.removed_questions or self.removed_options:
+            session.execute(delete(Option).where(or_(Option.question_id.in_(self.removed_questions),
+                                                     Option.id.in_(self.removed_options))),
+                            execution_options=bulk)
+        if self.removed_questions:
+            session.execute(delete(Question).where(Question.id.in_(self.removed_questions)),
+                            execution_options=bulk)
+        # UPDATE ... WHERE id = ?, batched per set of changed columns
+        if self.updated_questions:
+            session.execute(update(Question), self.updated_questions)
+        if self.updated_options:
+            session.execute(update(Option), self.updated_options)
+
+        added_questions = []
+        if self.added_questions:
+            default_time_limit = Question.__table__.c.time_limit.default.arg
+            question_ids = insert_ids(Question, [{'quiz_id': quiz_id, 'text': question['text'],
+                                                  'time_limit': question.get('time_limit', default_time_limit)}
+                                                 for question in self.added_questions])
+            for question_id, question in zip(question_ids, self.added_questions):
+                added_questions.append({
+                    'id': question_id,
+                    'quiz_id': quiz_id,
+                    'text': question['text'],
+                    'time_limit': question.get('time_limit', default_time_limit),
+                    'options': [dict(option, question_id=question_id) for option in question['options']]
+                })
+
+        # Options of new questions and options added to existing ones, in one INSERT
+        added_options = [dict(option) for option in self.added_options]
+        new_options = [option for question in added_questions for option in question['options']] + added_options
+        if new_options:
+            option_ids = insert_ids(Option, [{'question_id': option['question_id'], 'text': option['text'],
+                                              'is_correct': option['is_correct']} for option in new_options])
+            for option_id, option in zip(option_ids, new_options):
+                option['id'] = option_id
+
+        result['questions'] = {
+            'added': added_questions,
+            'updated': self.updated_questions,
+            'removed': self.removed_questions
+        }
+        result['options'] = {
+            'added': added_options,
+            'updated': self.updated_options,
+            'removed': self.removed_options
+        }
+        return result
+
+def section(data, key):
+    value = data.get(key) or {}
+    if not isinstance(value, dict) or set(value) - {'add', 'update', 'remove'}:
+        raise ValueError('{} must be an object with add, update and/or remove'.format(key))
+    for action, items in value.items():
+        if not isinstance(items, list):
+            raise ValueError('{}.{} must be a list'.format(key, action))
+    return value
+
+def ids(values, kind):
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        raise ValueError('{} id is invalid.'.format(kind))
+    return list(values)
+
+def check_value(field, value):
+    if field == 'time_limit':
+        Question.check_time_limit(value)
+    elif field == 'is_correct':
+        if not isinstance(value, bool):
+            raise ValueError('Option is_correct must be true or false')
+    elif not isinstance(value, str) or not value:
+        raise ValueError('{} is required'.format(field.capitalize()))
+
+def changes(data, fields, kind):
+    # {'id': ..., changed field: new value, ...} for an UPDATE by primary key
+    if not isinstance(data, dict) or data.get('id') is None:
+        raise ValueError('{} id is missing in the provided data.'.format(kind))
+    ids([data['id']], kind)
+    values = {'id': data['id']}
+    for field in fields:
+        if field in data:
+            check_value(field, data[field])
+            values[field] = data[field]
+    if len(values) == 1:
+        raise ValueError('{} {} has nothing to update'.format(kind, data['id']))
+    return values
+
+def new_question(data):
+    if not isinstance(data, dict) or 'text' not in data:
+        raise ValueError('Question text is required')
+    if not data.get('options'):
+        raise ValueError('At least 1 option is required')
+    question = {'text': data['text'], 'options': [new_option(option) for option in data['options']]}
+    check_value('text', data['text'])
+    if 'time_limit' in data:
+        question['time_limit'] = Question.check_time_limit(data['time_limit'])
+    return question
+
+def new_option(data, standalone=False):
+    if not isinstance(data, dict) or 'text' not in data:
+        raise ValueError('Option text is required')
+    if 'is_correct' not in data:
+        raise ValueError('Option correctness is required')
+    check_value('text', data['text'])
+    check_value('is_correct', data['is_correct'])
+    option = {'text': data['text'], 'is_correct': data['is_correct']}
+    if standalone:
+        if data.get('question_id') is None:
+            raise ValueError('Option question_id is missing in the provided data.')
+        option['question_id'] = ids([data['question_id']], 'Question')[0]
+    return option
@@ -0,0 +1,196 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import groupby
+from sqlalchemy import insert, select
+from app import app, db
+from app.models import Quiz, Question, Option
+from app.quizdiff import new_question
+from app.utils import insert_ids
+
+# Bulk quiz import and export for /quiz/import and /quiz/export.
+#
+# NDJSON: one quiz per line, shaped like the /create/quiz body:
+#     {"title": "...", "questions": [{"text": "...", "time_limit": 20,
+#                                     "options": [{"text": "...", "is_correct": true}]}]}
+# CSV: one row per option, rows of a quiz and of a question kept together:
+#     quiz,title,created_at,question,text,time_limit,option,is_correct
+# where quiz and question are any key that tells quizzes and questions apart
+# (export uses the ids). created_at may be left out or empty, as in NDJSON.
+#
+# Both directions stream: import parses the request body line by line and
+# inserts in batches, export yields rows from a yield_per query.
+
+CSV_COLUMNS = ['quiz', 'title', 'created_at', 'question', 'text', 'time_limit', 'option', 'is_correct']
+# Files written before created_at was exported still import
+CSV_OPTIONAL_COLUMNS = {'created_at'}
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+class QuizImportError(ValueError):
+    def __init__(self, message, line, imported):
+        super(QuizImportError, self).__init__('line {}: {} ({} quizzes imported before it)'.format(
+            line, message, imported))
+        self.imported = imported
+
+def read_ndjson(lines):
+    # Yields (line number, quiz data), or (line number, ValueError) for a
+    # line that cannot be parsed
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, ValueError('Line is not valid JSON')
+
+def read_csv(lines):
+    # Consecutive rows with the same quiz key are one quiz, and within it
+    # consecutive rows with the same question key are one question. A
+    # malformed row ends the input with (line number, ValueError).
+    reader = csv.DictReader(lines)
+    missing = set(CSV_COLUMNS) - CSV_OPTIONAL_COLUMNS - set(reader.fieldnames or ())
+    if missing:
+        raise QuizImportError('missing CSV columns: {}'.format(', '.join(sorted(missing))), 1, 0)
+    line = None
+    rows = []
+    try:
+        for row in reader:
+            if rows and row['quiz'] != rows[0]['quiz']:
+                yield line, csv_quiz(rows)
+                rows = []
+            # DictReader fills missing columns with None and puts extra ones under None
+            if None in row or None in row.values():
+                yield reader.line_num, ValueError('Row must have {} columns'.format(len(reader.fieldnames)))
+                return
+            if not rows:
+                line = reader.line_num
+            rows.append(row)
+    except csv.Error as e:
+        yield reader.line_num, ValueError('Malformed CSV: {}'.format(e))
+        return
+    if rows:
+        yield line, csv_quiz(rows)
+
+def csv_quiz(rows):
+    questions = []
+    for _, question_rows in groupby(rows, key=lambda row: row['question']):
+        question_rows = list(question_rows)
+        question = {'text': question_rows[0]['text'], 'options': [
+            {'text': row['option'], 'is_correct': parse_bool(row['is_correct'])}
+            for row in question_rows if row['option']
+        ]}
+        if question_rows[0]['time_limit']:
+            question['time_limit'] = parse_int(question_rows[0]['time_limit'])
+        questions.append(question)
+    return {'title': rows[0]['title'], 'created_at': rows[0].get('created_at'), 'questions': questions}
+
+def parse_bool(value):
+    # Anything else is passed through for new_option to reject
+    return {'true': True, '1': True, 'false': False, '0': False}.get(value.strip().lower(), value)
+
+def parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def new_quiz(data):
+    # The /create/quiz rules, checked without building ORM objects
+    if isinstance(data, ValueError):
+        raise data
+    if not isinstance(data, dict):
+        raise ValueError('Quiz must be a JSON object')
+    if 'title' not in data or 'questions' not in data:
+        raise ValueError('Title and questions are required')
+    if not isinstance(data['title'], str) or not data['title']:
+        raise ValueError('Title is required')
+    if not isinstance(data['questions'], list):
+        raise ValueError('Questions must be a list')
+    if not data['questions']:
+        raise ValueError('At least 1 question is required')
+    quiz = {'title': data['title'], 'questions': [new_question(question) for question in data['questions']]}
+    if data.get('created_at'):
+        if not isinstance(data['created_at'], str):
+            raise ValueError('created_at must be an ISO 8601 date')
+        quiz['created_at'] = datetime.fromisoformat(data['created_at'])
+    return quiz
+
+def insert_quizzes(user_id, quizzes, batch_size):
+    # quizzes yields (line number, quiz data). Each batch is three INSERTs
+    # (quizzes, questions, options) and its own commit, so memory and lock
+    # time stay flat however large the upload. Returns the number imported.
+    imported = 0
+    batch = []
+    for line, data in quizzes:
+        try:
+            batch.append(new_quiz(data))
+        except ValueError as e:
+            # Keep the valid quizzes that came before it
+            imported += insert_batch(user_id, batch)
+            raise QuizImportError(str(e), line, imported)
+        if len(batch) >= batch_size:
+            imported += insert_batch(user_id, batch)
+            batch = []
+    return imported + insert_batch(user_id, batch)
+
+def insert_batch(user_id, batch):
+    if not batch:
+        return 0
+    now = datetime.utcnow()
+    quiz_ids = insert_ids(Quiz, [{'user_id': user_id, 'title': quiz['title'], 'created_at': quiz.get('created_at', now)}
+                                 for quiz in batch])
+    default_time_limit = Question.__table__.c.time_limit.default.arg
+    questions = [(quiz_id, question) for quiz_id, quiz in zip(quiz_ids, batch) for question in quiz['questions']]
+    question_ids = insert_ids(Question, [{'quiz_id': quiz_id, 'text': question['text'],
+                                          'time_limit': question.get('time_limit', default_time_limit)}
+                                         for quiz_id, question in questions])
+    db.session.execute(insert(Option), [
+        {'question_id': question_id, 'text': option['text'], 'is_correct': option['is_correct']}
+        for question_id, (_, question) in zip(question_ids, questions) for option in question['options']
+    ])
+    db.session.commit()
+    return len(batch)
+
+def export_rows(user_id):
+    # One row per option (or per question/quiz with none), in quiz, question,
+    # option order, fetched yield_per rows at a time
+    query = select(Quiz.id, Quiz.title, Quiz.created_at, Question.id, Question.text, Question.time_limit,
+                   Option.id, Option.text, Option.is_correct) \
+        .outerjoin(Question, Question.quiz_id == Quiz.id) \
+        .outerjoin(Option, Option.question_id == Question.id) \
+        .where(Quiz.user_id == user_id) \
+        .order_by(Quiz.id, Question.id, Option.id) \
+        .execution_options(yield_per=app.config['QUIZ_EXPORT_YIELD_PER'])
+    return db.session.execute(query)
+
+def export_ndjson(user_id):
+    for (quiz_id, title, created_at), rows in groupby(export_rows(user_id), key=lambda row: row[:3]):
+        quiz = {'id': quiz_id, 'title': title, 'created_at': created_at.isoformat(), 'questions': []}
+        for (question_id, text, time_limit), question_rows in groupby(rows, key=lambda row: row[3:6]):
+            if question_id is None:
+                continue
+            quiz['questions'].append({
+                'id': question_id,
+                'text': text,
+                'time_limit': time_limit,
+                'options': [{'id': row[6], 'text': row[7], 'is_correct': row[8]}
+                            for row in question_rows if row[6] is not None]
+            })
+        yield json.dumps(quiz, separators=(',', ':')) + '\n'
+
+def export_csv(user_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for count, row in enumerate(export_rows(user_id), 1):
+        quiz_id, title, created_at, question_id, text, time_limit, _, option_text, is_correct = row
+        writer.writerow([quiz_id, title, created_at.isoformat(), question_id, text, time_limit, option_text,
+                         '' if is_correct is None else str(is_correct).lower()])
+        # Send the buffer in chunks rather than row by row
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,83 @@
+import heapq
+import time
+from datetime import datetime
+from app import app, db, jwt, state
+from app.models import RevokedToken
+
+VERSION_KEY = 'revoked:version'
+
+class RevocationStore(object):
+    # Revoked jtis with their exp. Lookups are a dict hit; a heap ordered by
+    # exp drops entries once the token would have expired anyway, so memory
+    # stays bounded by the number of logouts within one token lifetime. The
+    # revoked_token table keeps them across restarts. With a shared state
+    # store each revoke bumps a version counter; every worker checks it at
+    # most once per REVOCATION_REFRESH_MS and reloads the table when it has
+    # moved, so a revocation reaches other workers within that window while
+    # the per-event check stays local.
+
+    def __init__(self):
+        self.expiry = {}
+        self.heap = []
+        self.loaded = False
+        self.version = None
+        self.refresh_at = 0
+
+    def revoke(self, jti, exp):
+        now = time.time()
+        if exp <= now:
+            return
+        self._remember(jti, exp)
+        db.session.merge(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(exp)))
+        RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete()
+        db.session.commit()
+        if state.shared:
+            # After the commit, so a worker that sees the new version finds the row
+            state.incr(VERSION_KEY)
+
+    def is_revoked(self, jti):
+        now = time.time()
+        if not self.loaded:
+            self.load()
+        elif state.shared and now >= self.refresh_at:
+            self.refresh(now)
+        self._evict(now)
+        return jti in self.expiry
+
+    def refresh(self, now):
+        # Picks up tokens revoked on other workers
+        self.refresh_at = now + app.config['REVOCATION_REFRESH_MS'] / 1000.0
+        version = state.get(VERSION_KEY)
+        if version != self.version:
+            self.load()
+
+    def load(self):
+        self.loaded = True
+        if state.shared:
+            # Read before the table, so a revoke landing in between is
+            # picked up on the next refresh
+            self.version = state.get(VERSION_KEY)
+            self.refresh_at = time.time() + app.config['REVOCATION_REFRESH_MS'] / 1000.0
+        now = datetime.utcnow()
+        try:
+            for token in RevokedToken.query.filter(RevokedToken.expires_at >= now):
+                self._remember(token.jti, (token.expires_at - datetime(1970, 1, 1)).total_seconds())
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error('Could not load revoked tokens: %s', e)
+
+    def _remember(self, jti, exp):
+        if jti not in self.expiry:
+            heapq.heappush(self.heap, (exp, jti))
+        self.expiry[jti] = exp
+
+    def _evict(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            _, jti = heapq.heappop(self.heap)
+            self.expiry.pop(jti, None)
+
+revocations = RevocationStore()
+
+@jwt.token_in_blocklist_loader
+def check_if_token_in_blacklist(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload['jti'])
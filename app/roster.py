@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from app import db
+from app.connections import room_sockets
+from app.models import Participant, User
+
+# Lobby rosters keyed by session code. Built with one query the first time a
+# room is touched and then kept up to date as players join and leave, so a
+# join no longer reloads every participant and username. A roster is dropped
+# once this worker has no socket left in the room, so lobbies that never start
+# do not stay cached.
+rosters = {}
+
+class Roster(object):
+    def __init__(self, session):
+        self.session_code = session.code
+        self.session_id = session.id
+        self.host_id = session.host_id
+        self.load()
+
+    def load(self):
+        rows = db.session.query(User.id, User.username) \
+            .join(Participant, Participant.user_id == User.id) \
+            .filter(Participant.session_id == self.session_id) \
+            .order_by(Participant.id).all()
+        self.usernames = OrderedDict(rows)
+        host = self.usernames.get(self.host_id)
+        self.host = host if host is not None else db.session.get(User, self.host_id).username
+
+    def add(self, user_id, username):
+        # Returns False if the user was already listed
+        if user_id in self.usernames:
+            return False
+        self.usernames[user_id] = username
+        return True
+
+    def remove(self, user_id):
+        return self.usernames.pop(user_id, None)
+
+    def payload(self):
+        return {
+            'host': self.host,
+            'participants': list(self.usernames.values())
+        }
+
+def get_roster(session):
+    roster = rosters.get(session.code)
+    if roster is None:
+        roster = rosters[session.code] = Roster(session)
+    return roster
+
+def drop_roster(session_code):
+    rosters.pop(session_code, None)
+
+def release_roster(session_code):
+    # Called after a socket leaves the room; rebuilt from the database if
+    # anyone comes back
+    if session_code not in room_sockets:
+        drop_roster(session_code)
@@ -1,11 +1,15 @@
-from flask import request, jsonify
+from flask import request, jsonify, stream_with_context
 from app import app, db
 from app.models import *
 from app.errors import bad_request, error_response
-from app.utils import generate_unique_code
+from app.utils import generate_unique_code, encode_cursor, decode_cursor, unit_of_work
+from app.cache import quiz_cache, quiz_version, bump_quiz_version
+from app.quizdiff import QuizDiff
+from app.quizio import QuizImportError, FORMATS, read_ndjson, read_csv, insert_quizzes, export_ndjson, export_csv
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
-from app import blacklist
+from app.revocation import revocations
 from flask_jwt_extended.exceptions import NoAuthorizationError
+from sqlalchemy.exc import IntegrityError
 
 @app.route('/uid', methods=['GET'])
 @jwt_required()
@@ -29,8 +33,8 @@ def login():
 @app.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklist.add(jti)
+    claims = get_jwt()
+    revocations.revoke(claims['jti'], claims['exp'])
     return jsonify({'message': 'logout success'})
 
 @app.route('/register', methods=['POST'])
@@ -84,13 +88,23 @@ def create_quiz():
 @app.route('/quiz/<int:quiz_id>', methods=['GET'])
 @jwt_required()
 def get_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
     user_id = get_jwt_identity()
+    # Serve the cached bytes for the current version when we have them
+    version = quiz_version(quiz_id)
+    snapshot = quiz_cache.get(quiz_id, version)
+    if snapshot is None:
+        quiz = Quiz.query_with_tree().filter_by(id=quiz_id).first_or_404()
+        snapshot = quiz_cache.put(quiz_id, version, quiz.user_id, quiz.to_dict())
     # Check if the current user is the owner of the quiz
-    if quiz.user_id != user_id:
+    if snapshot.user_id != user_id:
         return error_response(403, 'You do not have permission to access this quiz.')
-    
-    return jsonify(quiz.to_dict())
+
+    if request.if_none_match.contains(snapshot.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    return response
 
 @app.route('/quiz/<int:quiz_id>', methods=['PUT'])
 @jwt_required()
@@ -107,6 +121,7 @@ def update_quiz(quiz_id):
     try:
         quiz.from_dict(data)
         db.session.commit()
+        bump_quiz_version(quiz_id)
     except ValueError as e:
         db.session.rollback()  # Rollback any changes if an exception occurs
         return bad_request(str(e))
@@ -116,6 +131,39 @@ def update_quiz(quiz_id):
     
     return jsonify(quiz.to_dict())
 
+@app.route('/quiz/<int:quiz_id>', methods=['PATCH'])
+@jwt_required()
+def patch_quiz(quiz_id):
+    # Applies a diff of added, changed and removed questions and options (see
+    # app/quizdiff.py) and returns only what changed
+    user_id = get_jwt_identity()
+    try:
+        diff = QuizDiff(request.get_json(silent=True))
+    except ValueError as e:
+        return bad_request(str(e))
+
+    # Ownership of the quiz and of every referenced row, in one query
+    owner_id = diff.load(quiz_id)
+    if owner_id is None:
+        return error_response(404, 'Quiz not found')
+    if owner_id != user_id:
+        return error_response(403, 'You do not have permission to access this quiz.')
+
+    try:
+        diff.check_references()
+        changes = diff.apply(quiz_id)
+        diff.check_result(quiz_id)
+        db.session.commit()
+        bump_quiz_version(quiz_id)
+    except ValueError as e:
+        db.session.rollback()
+        return bad_request(str(e))
+    except Exception as e:
+        db.session.rollback()
+        return error_response(500, str(e))
+
+    return jsonify(changes)
+
 @app.route('/quiz/<int:quiz_id>', methods=['DELETE'])
 @jwt_required()
 def delete_quiz(quiz_id):
@@ -127,15 +175,114 @@ def delete_quiz(quiz_id):
     
     db.session.delete(quiz)
     db.session.commit()
+    bump_quiz_version(quiz_id)
     
     return jsonify({'message': 'Quiz deleted successfully'})
 
+@app.route('/quiz/import', methods=['POST'])
+@jwt_required()
+def import_quizzes():
+    # Streams NDJSON or CSV from the request body (see app/quizio.py)
+    user_id = get_jwt_identity()
+    format = transfer_format()
+    if format is None:
+        return bad_request('format must be ndjson or csv')
+    lines = (line.decode('utf-8') for line in request.stream)
+    quizzes = read_ndjson(lines) if format == 'ndjson' else read_csv(lines)
+    try:
+        imported = insert_quizzes(user_id, quizzes, app.config['QUIZ_IMPORT_BATCH_SIZE'])
+    except QuizImportError as e:
+        # Batches before the bad line are already committed
+        db.session.rollback()
+        response = jsonify({'error': 'Bad Request', 'message': str(e), 'imported': e.imported})
+        response.status_code = 400
+        return response
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return bad_request('Body must be UTF-8')
+    except Exception as e:
+        db.session.rollback()
+        return error_response(500, str(e))
+
+    response = jsonify({'imported': imported})
+    response.status_code = 201
+    return response
+
+@app.route('/quiz/export', methods=['GET'])
+@jwt_required()
+def export_quizzes():
+    # Every quiz of the current user, generated while it is sent
+    user_id = get_jwt_identity()
+    format = transfer_format()
+    if format is None:
+        return bad_request('format must be ndjson or csv')
+    rows = export_ndjson(user_id) if format == 'ndjson' else export_csv(user_id)
+    return app.response_class(stream_with_context(rows), mimetype=FORMATS[format])
+
+def transfer_format():
+    # ?format=ndjson|csv, otherwise taken from the Content-Type
+    format = request.args.get('format')
+    if format is None:
+        format = 'csv' if request.mimetype == FORMATS['csv'] else 'ndjson'
+    return format if format in FORMATS else None
+
 @app.route('/quiz/all', methods=['GET'])
 @jwt_required()
 def get_all_quizzes():
     user_id = get_jwt_identity()
-    quizzes = Quiz.query.filter_by(user_id=user_id).all()
-    return jsonify([quiz.to_dict() for quiz in quizzes])
+    fields = request.args.get('fields')
+    if fields not in (None, 'summary'):
+        return bad_request('fields must be summary')
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    # Without limit or cursor the whole list is returned, as before
+    paginate = limit is not None or cursor is not None
+    if paginate:
+        if limit is None:
+            limit = 20
+        else:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = None
+            if limit is None or not 1 <= limit <= 100:
+                return bad_request('limit must be an integer between 1 and 100')
+
+    if fields == 'summary':
+        query = Quiz.query_summary()
+    else:
+        query = Quiz.query_with_tree()
+    query = query.filter(Quiz.user_id == user_id).order_by(Quiz.created_at, Quiz.id)
+
+    if cursor is not None:
+        try:
+            created_at, quiz_id = decode_cursor(cursor)
+        except ValueError as e:
+            return bad_request(str(e))
+        query = query.filter(db.or_(Quiz.created_at > created_at,
+                                    db.and_(Quiz.created_at == created_at, Quiz.id > quiz_id)))
+    if paginate:
+        # One extra row tells us whether there is a next page
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = query.all()
+
+    if fields == 'summary':
+        quizzes = [{
+            'id': row.id,
+            'title': row.title,
+            'created_at': row.created_at,
+            'question_count': row.question_count
+        } for row in rows]
+    else:
+        quizzes = [quiz.to_dict() for quiz in rows]
+
+    if not paginate:
+        return jsonify(quizzes)
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    return jsonify({'quizzes': quizzes, 'next_cursor': next_cursor})
 
 
 # -------- SESSION ---------
@@ -153,13 +300,20 @@ def create_session():
     if quiz.user_id != user_id:
         return error_response(403, 'You do not have permission to create a session for this quiz.')
     
-    session_code = generate_unique_code()  # Implement this function to generate a unique code
-    session = Session(quiz_id=quiz.id, host_id=user_id, code=session_code)
-    db.session.add(session)
-    db.session.commit()
-    participant = Participant(session_id=session.id, user_id=user_id)
-    db.session.add(participant)
-    db.session.commit()
+    # The session and its host participant are inserted in one transaction
+    for attempt in range(2):
+        session_code = generate_unique_code()
+        try:
+            with unit_of_work() as uow:
+                session = Session(quiz_id=quiz.id, host_id=user_id, code=session_code)
+                uow.add(session)
+                uow.add(Participant(session=session, user_id=user_id))
+            break
+        except IntegrityError:
+            # Only possible against a code issued before this allocator, or after the
+            # in-process sequence was reseeded too low
+            if attempt:
+                raise
     
     response = jsonify({'session_code': session_code})
     response.status_code = 201
@@ -181,9 +335,11 @@ def join_session():
     
     user_id = get_jwt_identity()
 
-    # Add participant to session
-    participant = Participant(session_id=session.id, user_id=user_id)
-    db.session.add(participant)
-    db.session.commit()
+    # Add participant to session; joining twice is a no-op thanks to the unique index
+    try:
+        with unit_of_work() as uow:
+            uow.add(Participant(session_id=session.id, user_id=user_id))
+    except IntegrityError:
+        pass
 
     return jsonify({'message': 'Joined session successfully'})
\ No newline at end of file
@@ -0,0 +1,53 @@
+import heapq
+import itertools
+import threading
+import time
+from app import app, socketio
+
+class Scheduler(object):
+    # A single greenthread drives every deadline (question timers, coalesced
+    # broadcasts). Timers sit in a heap ordered by deadline, so scheduling is
+    # O(log n) however many rooms are live. Cancelling only marks the timer;
+    # it is dropped when it reaches the top of the heap.
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = threading.Event()
+        self.worker = None
+
+    def schedule(self, delay, callback, *args):
+        deadline = time.monotonic() + delay
+        # [deadline, tie-breaker, callback, args, cancelled]
+        timer = [deadline, next(self.counter), callback, args, False]
+        heapq.heappush(self.heap, timer)
+        if self.worker is None:
+            self.worker = socketio.start_background_task(self._run)
+        elif self.heap[0] is timer:
+            # New earliest deadline; cut the current sleep short
+            self.wakeup.set()
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None:
+            timer[4] = True
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            while self.heap and (self.heap[0][4] or self.heap[0][0] <= now):
+                timer = heapq.heappop(self.heap)
+                if not timer[4]:
+                    socketio.start_background_task(self._fire, timer[2], timer[3])
+            timeout = self.heap[0][0] - now if self.heap else None
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def _fire(self, callback, args):
+        with app.app_context():
+            try:
+                callback(*args)
+            except Exception as e:
+                app.logger.error('Scheduled %s failed: %s', getattr(callback, '__name__', callback), e)
+
+scheduler = Scheduler()
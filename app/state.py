@@ -0,0 +1,312 @@
+import sqlite3
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Game progression counters and other cross-worker state live behind this
+# interface so that every worker sees the same values. Values are returned as
+# strings (or None when missing) except for incr, which returns the new
+# integer value.
+
+class StateStore(object):
+    # True when other processes can see the same state
+    shared = True
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        # ttl in seconds; the key disappears once it passes
+        raise NotImplementedError
+
+    def setnx(self, key, value):
+        # Sets key only if it does not exist yet; returns True if it was set
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def incr(self, key, amount=1):
+        raise NotImplementedError
+
+    def compare_and_set(self, key, expected, value):
+        # Sets key to value only if it currently equals expected; returns
+        # True for exactly one of several concurrent callers
+        raise NotImplementedError
+
+    def sadd(self, key, member):
+        # Returns True if the member was not already in the set
+        raise NotImplementedError
+
+    def srem(self, key, member):
+        # Returns True if the member was in the set
+        raise NotImplementedError
+
+    def sismember(self, key, member):
+        raise NotImplementedError
+
+    def scard(self, key):
+        raise NotImplementedError
+
+    def smembers(self, key):
+        raise NotImplementedError
+
+    def hincr(self, key, field, amount=1):
+        # Adds amount to one integer field of a hash; returns the new value
+        raise NotImplementedError
+
+    def hset(self, key, field, value):
+        raise NotImplementedError
+
+    def hget(self, key, field):
+        raise NotImplementedError
+
+    def hgetall(self, key):
+        # {field: value} with both as strings
+        raise NotImplementedError
+
+class MemoryStateStore(StateStore):
+    # Single-process store; greenlets only switch on I/O so plain dict
+    # operations are already atomic here
+    shared = False
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+        self.hashes = {}
+        self.expires = {}
+
+    def get(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+        value = self.values.get(key)
+        return None if value is None else str(value)
+
+    def set(self, key, value, ttl=None):
+        self.values[key] = value
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.time() + ttl
+
+    def setnx(self, key, value):
+        if self.get(key) is not None:
+            return False
+        self.set(key, value)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+            self.hashes.pop(key, None)
+            self.expires.pop(key, None)
+
+    def incr(self, key, amount=1):
+        value = int(self.values.get(key, 0)) + amount
+        self.values[key] = value
+        return value
+
+    def compare_and_set(self, key, expected, value):
+        current = self.values.get(key)
+        if current is None or str(current) != str(expected):
+            return False
+        self.values[key] = value
+        return True
+
+    def sadd(self, key, member):
+        members = self.sets.setdefault(key, set())
+        if str(member) in members:
+            return False
+        members.add(str(member))
+        return True
+
+    def srem(self, key, member):
+        members = self.sets.get(key)
+        if not members or str(member) not in members:
+            return False
+        members.discard(str(member))
+        if not members:
+            # Like redis, an empty set is no key at all
+            del self.sets[key]
+        return True
+
+    def sismember(self, key, member):
+        return str(member) in self.sets.get(key, ())
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def hincr(self, key, field, amount=1):
+        fields = self.hashes.setdefault(key, {})
+        value = fields.get(str(field), 0) + amount
+        fields[str(field)] = value
+        return value
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[str(field)] = value
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(str(field))
+        return None if value is None else str(value)
+
+    def hgetall(self, key):
+        return {field: str(value) for field, value in self.hashes.get(key, {}).items()}
+
+class RedisStateStore(StateStore):
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('The redis package is required for a redis:// state store')
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.cas_script = self.client.register_script(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then "
+            "redis.call('set', KEYS[1], ARGV[2]) return 1 end return 0")
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=None if ttl is None else max(int(ttl), 1))
+
+    def setnx(self, key, value):
+        return bool(self.client.set(key, value, nx=True))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
+    def incr(self, key, amount=1):
+        return self.client.incrby(key, amount)
+
+    def compare_and_set(self, key, expected, value):
+        return bool(self.cas_script(keys=[key], args=[str(expected), str(value)]))
+
+    def sadd(self, key, member):
+        return self.client.sadd(key, member) == 1
+
+    def srem(self, key, member):
+        return self.client.srem(key, member) == 1
+
+    def sismember(self, key, member):
+        return bool(self.client.sismember(key, member))
+
+    def scard(self, key):
+        return self.client.scard(key)
+
+    def smembers(self, key):
+        return self.client.smembers(key)
+
+    def hincr(self, key, field, amount=1):
+        return self.client.hincrby(key, field, amount)
+
+    def hset(self, key, field, value):
+        self.client.hset(key, field, value)
+
+    def hget(self, key, field):
+        return self.client.hget(key, field)
+
+    def hgetall(self, key):
+        return self.client.hgetall(key)
+
+class SQLiteStateStore(StateStore):
+    # Shared store for several workers on one host, or for tests. WAL lets
+    # readers run alongside the single writer and every statement commits on
+    # its own (autocommit), so incr is atomic across processes.
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS members (key TEXT NOT NULL, member TEXT NOT NULL, '
+                          'PRIMARY KEY (key, member))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fields (key TEXT NOT NULL, field TEXT NOT NULL, '
+                          'value TEXT NOT NULL, PRIMARY KEY (key, field))')
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _rowcount(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def get(self, key):
+        rows = self._execute('SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                             (key, time.time()))
+        return rows[0][0] if rows else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = None if ttl is None else time.time() + ttl
+        self._execute('INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+                      'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                      (key, str(value), expires_at))
+
+    def setnx(self, key, value):
+        return self._rowcount('INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)', (key, str(value))) == 1
+
+    def delete(self, *keys):
+        for key in keys:
+            self._execute('DELETE FROM kv WHERE key = ?', (key,))
+            self._execute('DELETE FROM members WHERE key = ?', (key,))
+            self._execute('DELETE FROM fields WHERE key = ?', (key,))
+
+    def incr(self, key, amount=1):
+        rows = self._execute('INSERT INTO kv (key, value) VALUES (?, ?) '
+                             'ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + ? '
+                             'RETURNING value', (key, str(amount), amount))
+        return int(rows[0][0])
+
+    def compare_and_set(self, key, expected, value):
+        return self._rowcount('UPDATE kv SET value = ? WHERE key = ? AND value = ?',
+                              (str(value), key, str(expected))) == 1
+
+    def sadd(self, key, member):
+        return self._rowcount('INSERT OR IGNORE INTO members (key, member) VALUES (?, ?)',
+                              (key, str(member))) == 1
+
+    def srem(self, key, member):
+        return self._rowcount('DELETE FROM members WHERE key = ? AND member = ?', (key, str(member))) == 1
+
+    def sismember(self, key, member):
+        return bool(self._execute('SELECT 1 FROM members WHERE key = ? AND member = ?', (key, str(member))))
+
+    def scard(self, key):
+        return self._execute('SELECT COUNT(*) FROM members WHERE key = ?', (key,))[0][0]
+
+    def smembers(self, key):
+        return {row[0] for row in self._execute('SELECT member FROM members WHERE key = ?', (key,))}
+
+    def hincr(self, key, field, amount=1):
+        rows = self._execute('INSERT INTO fields (key, field, value) VALUES (?, ?, ?) '
+                             'ON CONFLICT(key, field) DO UPDATE SET value = CAST(value AS INTEGER) + ? '
+                             'RETURNING value', (key, str(field), str(amount), amount))
+        return int(rows[0][0])
+
+    def hset(self, key, field, value):
+        self._execute('INSERT INTO fields (key, field, value) VALUES (?, ?, ?) '
+                      'ON CONFLICT(key, field) DO UPDATE SET value = excluded.value', (key, str(field), str(value)))
+
+    def hget(self, key, field):
+        rows = self._execute('SELECT value FROM fields WHERE key = ? AND field = ?', (key, str(field)))
+        return rows[0][0] if rows else None
+
+    def hgetall(self, key):
+        return dict(self._execute('SELECT field, value FROM fields WHERE key = ?', (key,)))
+
+def create_state_store(url):
+    if not url or url.startswith('memory://'):
+        return MemoryStateStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):])
+    raise ValueError('Unsupported state store url: {}'.format(url))
@@ -1,11 +1,156 @@
-import secrets
+import base64
+import hashlib
+import hmac
 import string
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, has_app_context
+from sqlalchemy import event, insert
+from app import app, db, state
 from app.models import Session
 
+CODE_CHARACTERS = string.ascii_letters + string.digits
+
+CODE_ROUNDS = 8
+
+class CodePermutation(object):
+    # Keyed permutation of [0, 62**length): a Feistel network whose round
+    # function is HMAC-SHA256 keyed by SECRET_KEY. Every sequence number gets
+    # a different code until the whole space has been used, and without the
+    # key one code says nothing about the next. A number is split into a
+    # left part of length // 2 characters and a right part of the rest; the
+    # rounds alternate between the two sizes, so odd lengths need no
+    # cycle-walking either.
+    def __init__(self, length):
+        self.space = len(CODE_CHARACTERS) ** length
+        self.sizes = (len(CODE_CHARACTERS) ** (length // 2), len(CODE_CHARACTERS) ** (length - length // 2))
+        self.key = hashlib.sha256(('session-code:' + app.config['SECRET_KEY']).encode()).digest()
+
+    def round(self, number, value):
+        digest = hmac.new(self.key, '{}:{}'.format(number, value).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], 'big') % self.sizes[number % 2]
+
+    def encrypt(self, number):
+        left, right = divmod(number, self.sizes[1])
+        for i in range(CODE_ROUNDS):
+            left, right = right, (left + self.round(i, right)) % self.sizes[i % 2]
+        return left * self.sizes[1] + right
+
+    def decrypt(self, number):
+        left, right = divmod(number, self.sizes[1])
+        for i in reversed(range(CODE_ROUNDS)):
+            left, right = (right - self.round(i, left)) % self.sizes[i % 2], left
+        return left * self.sizes[1] + right
+
+def encode_code(number, length):
+    chars = []
+    for _ in range(length):
+        number, index = divmod(number, len(CODE_CHARACTERS))
+        chars.append(CODE_CHARACTERS[index])
+    return ''.join(reversed(chars))
+
+def decode_code(code):
+    number = 0
+    for char in code:
+        number = number * len(CODE_CHARACTERS) + CODE_CHARACTERS.index(char)
+    return number
+
 def generate_unique_code(length=6):
-    characters = string.ascii_letters + string.digits
-    while True:
-        code = ''.join(secrets.choice(characters) for _ in range(length))
-        if not Session.query.filter_by(code=code).first():
-            break
-    return code
+    # One atomic increment in the state store reserves the next code, so
+    # concurrent requests on any worker never get the same one
+    permutation = CodePermutation(length)
+    key = 'session_code_seq:{}'.format(length)
+    if state.get(key) is None:
+        seed_code_sequence(key, permutation)
+    sequence = state.incr(key)
+    return encode_code(permutation.encrypt(sequence % permutation.space), length)
+
+def seed_code_sequence(key, permutation):
+    # After a restart with an in-process store, continue after the newest
+    # session's code (plus a margin for codes handed out but never committed)
+    latest = db.session.query(Session.code).order_by(Session.id.desc()).first()
+    sequence = 0
+    if latest is not None:
+        try:
+            sequence = permutation.decrypt(decode_code(latest.code)) + 1000
+        except ValueError:
+            pass
+    state.setnx(key, sequence)
+
+
+@contextmanager
+def unit_of_work():
+    # Everything added inside the block goes to the database in one
+    # transaction and one commit; any exception rolls all of it back
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def insert_ids(model, rows):
+    # Bulk INSERT returning the new primary keys in the order of rows. SQLite
+    # cannot order RETURNING rows, and asking SQLAlchemy to sort them there
+    # falls back to one INSERT per row; but one SQLite INSERT hands out rowids
+    # in VALUES order under the write lock, so sorting the ids is enough.
+    if db.engine.dialect.name == 'sqlite':
+        return sorted(db.session.scalars(insert(model).returning(model.id), rows).all())
+    return db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows).all()
+
+@contextmanager
+def count_queries():
+    # Collects every SQL statement run inside the block, e.g.
+    #     with count_queries() as statements:
+    #         client.get('/quiz/all')
+    #     assert len(statements) == 3
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def observe_statements(observer):
+    # Calls observer(statement, seconds) for every SQL statement run in the
+    # current app context until unobserve_statements(observer). /metrics and
+    # the SQL profiler both time statements through the one pair of engine
+    # listeners below.
+    g.setdefault('sql_observers', []).append(observer)
+
+def unobserve_statements(observer):
+    observers = g.get('sql_observers')
+    if observers and observer in observers:
+        observers.remove(observer)
+
+with app.app_context():
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and g.get('sql_observers'):
+            conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+    @event.listens_for(db.engine, 'after_cursor_execute')
+    def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('statement_started')
+        if started and has_app_context() and g.get('sql_observers'):
+            seconds = time.perf_counter() - started.pop()
+            for observer in g.sql_observers:
+                observer(statement, seconds)
+
+def encode_cursor(created_at, id):
+    # Opaque keyset cursor pointing just after the row with this (created_at, id)
+    raw = '{}|{}'.format(created_at.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('cursor is invalid')
@@ -0,0 +1,130 @@
+import threading
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db, socketio
+from app.models import Response, Score
+
+class WriteBehindQueue(object):
+    # Collects Response inserts and Score deltas from the answer hot path and
+    # writes them in one transaction, either periodically or when asked to
+    # (question boundaries, quiz end)
+
+    def __init__(self, interval_ms=200, max_retries=3):
+        self.interval = interval_ms / 1000.0
+        self.max_retries = max_retries
+        self.responses = []
+        self.score_deltas = {}
+        # Consecutive failed flushes of the batch at the head of the queue
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def add_response(self, session_id, participant_id, question_id, option_id, response_time):
+        self.responses.append({
+            'session_id': session_id,
+            'participant_id': participant_id,
+            'question_id': question_id,
+            'option_id': option_id,
+            'response_time': response_time
+        })
+        self._ensure_worker()
+
+    def add_score(self, session_id, participant_id, delta):
+        key = (session_id, participant_id)
+        self.score_deltas[key] = self.score_deltas.get(key, 0) + delta
+        self._ensure_worker()
+
+    def flush(self):
+        # Serialize flushes so two batches never upsert the same Score row at once
+        with self.lock:
+            # Swap the buffers before touching the database so new answers
+            # keep queueing while this batch is written
+            responses, self.responses = self.responses, []
+            score_deltas, self.score_deltas = self.score_deltas, {}
+            if not responses and not score_deltas:
+                return
+            try:
+                self._write(responses, score_deltas)
+                self.failures = 0
+            except Exception:
+                db.session.rollback()
+                self.failures += 1
+                if self.failures > self.max_retries:
+                    # Something in the batch keeps failing; write what can
+                    # be written row by row and drop the rest
+                    self.failures = 0
+                    self._salvage(responses, score_deltas)
+                    raise
+                # Put the batch back so the next flush retries it
+                self.responses[:0] = responses
+                for key, delta in score_deltas.items():
+                    self.score_deltas[key] = self.score_deltas.get(key, 0) + delta
+                raise
+
+    def _write(self, responses, score_deltas):
+        if responses:
+            db.session.execute(insert(Response), responses)
+        if score_deltas:
+            self._upsert_scores(score_deltas)
+        db.session.commit()
+
+    def _salvage(self, responses, score_deltas):
+        for response in responses:
+            self._write_or_drop([response], {}, response)
+        for key, delta in score_deltas.items():
+            self._write_or_drop([], {key: delta}, {'session_id': key[0], 'participant_id': key[1], 'score': delta})
+
+    def _write_or_drop(self, responses, score_deltas, row):
+        try:
+            self._write(responses, score_deltas)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error('Write-behind dropped %s after %d failed flushes: %s', row, self.max_retries + 1, e)
+
+    def _upsert_scores(self, score_deltas):
+        dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+        dialect = dialects.get(db.engine.dialect.name)
+        if dialect is not None:
+            # One INSERT ... ON CONFLICT on the unique (session_id, participant_id) index
+            rows = [{'session_id': session_id, 'participant_id': participant_id, 'score': delta}
+                    for (session_id, participant_id), delta in score_deltas.items()]
+            stmt = dialect.insert(Score)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['session_id', 'participant_id'],
+                set_={'score': Score.score + stmt.excluded.score})
+            db.session.execute(stmt, rows)
+            return
+
+        session_ids = {session_id for session_id, _ in score_deltas}
+        participant_ids = {participant_id for _, participant_id in score_deltas}
+        existing = db.session.query(Score.id, Score.session_id, Score.participant_id, Score.score) \
+            .filter(Score.session_id.in_(session_ids), Score.participant_id.in_(participant_ids)).all()
+        existing = {(row.session_id, row.participant_id): row for row in existing}
+
+        updates = []
+        inserts = []
+        for key, delta in score_deltas.items():
+            row = existing.get(key)
+            if row:
+                updates.append({'id': row.id, 'score': row.score + delta})
+            else:
+                inserts.append({'session_id': key[0], 'participant_id': key[1], 'score': delta})
+        if updates:
+            db.session.execute(update(Score), updates)
+        if inserts:
+            db.session.execute(insert(Score), inserts)
+
+    def _ensure_worker(self):
+        if self.worker is None:
+            self.worker = socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    app.logger.error('Write-behind flush failed: %s', e)
+
+write_behind = WriteBehindQueue(app.config['WRITE_BEHIND_INTERVAL_MS'], app.config['WRITE_BEHIND_MAX_RETRIES'])
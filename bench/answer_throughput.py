@@ -0,0 +1,112 @@
+"""Answer-submission throughput under each DATABASE_PROFILE.
+
+For every profile a child process plays a full game through the Socket.IO
+test client (--players answering --questions each, write-behind flushes
+included) and also times committing one Response per answer, the way
+submit_answer used to. Runs on a scratch SQLite file unless --database-url
+points somewhere else.
+
+    python bench/answer_throughput.py --players 100 --questions 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--players', type=int, default=100)
+parser.add_argument('--questions', type=int, default=10)
+parser.add_argument('--commits', type=int, default=500)
+parser.add_argument('--profiles', default='default,tuned')
+parser.add_argument('--database-url')
+parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+def run_child():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from datetime import datetime
+    from app import app, db, socketio
+    from app.models import Response
+    from app.writebehind import write_behind
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    tokens = []
+    for i in range(args.players):
+        client.post('/register', json={'username': 'p{}'.format(i), 'email': 'p{}@example.com'.format(i),
+                                       'password': 'p'})
+        tokens.append(client.post('/login', json={'username': 'p{}'.format(i), 'password': 'p'}).json['access_token'])
+    headers = [{'Authorization': 'Bearer ' + token} for token in tokens]
+    quiz = {'title': 'bench', 'questions': [
+        {'text': 'q{}'.format(k), 'time_limit': 600,
+         'options': [{'text': 'a', 'is_correct': True}, {'text': 'b', 'is_correct': False}]}
+        for k in range(args.questions)]}
+    quiz_id = client.post('/create/quiz', json=quiz, headers=headers[0]).json['id']
+    code = client.post('/create/session', json={'quiz_id': quiz_id}, headers=headers[0]).json['session_code']
+    for h in headers[1:]:
+        client.post('/join/session', json={'session_code': code}, headers=h)
+    players = [socketio.test_client(app, headers=h, flask_test_client=client) for h in headers]
+    for player in players:
+        player.emit('join_session', {'session_code': code})
+    players[0].emit('start_quiz', {'session_code': code})
+    question = [e for e in players[-1].get_received() if e['name'] == 'next_question'][-1]['args'][0]
+
+    started = time.perf_counter()
+    for _ in range(args.questions):
+        for i, player in enumerate(players):
+            player.emit('submit_answer', {'session_code': code, 'question_id': question['question_id'],
+                                          'option_id': question['options'][i % 2]['id']})
+        received = [e for e in players[-1].get_received() if e['name'] == 'next_question']
+        if received:
+            question = received[-1]['args'][0]
+    game_elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        write_behind.flush()
+        started = time.perf_counter()
+        for _ in range(args.commits):
+            db.session.add(Response(session_id=1, participant_id=1, question_id=1, option_id=1,
+                                    response_time=datetime.utcnow()))
+            db.session.commit()
+        commit_elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        'answers_per_second': args.players * args.questions / game_elapsed,
+        'commits_per_second': args.commits / commit_elapsed
+    }))
+
+def run_parent():
+    results = {}
+    for profile in args.profiles.split(','):
+        env = dict(os.environ, DATABASE_PROFILE=profile)
+        db_path = None
+        if args.database_url:
+            env['DATABASE_URL'] = args.database_url
+        else:
+            db_path = tempfile.mktemp(suffix='.db')
+            env['DATABASE_URL'] = 'sqlite:///' + db_path
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child',
+                                 '--players', str(args.players), '--questions', str(args.questions),
+                                 '--commits', str(args.commits)],
+                                env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+        if db_path:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    print('{} players x {} questions'.format(args.players, args.questions))
+    print('{:<10} {:>18} {:>22}'.format('profile', 'game answers/s', 'commit-per-answer/s'))
+    for profile, result in results.items():
+        print('{:<10} {:>18.0f} {:>22.0f}'.format(profile, result['answers_per_second'],
+                                                   result['commits_per_second']))
+
+if args.child:
+    run_child()
+else:
+    run_parent()
@@ -0,0 +1,96 @@
+"""Lookup times on the hot Participant, Score and Response columns, with and
+without the indexes added in migration c7e215f9a8b0.
+
+Fills a scratch SQLite database with --rows participants, scores and
+responses, times the lookups the socket handlers make, then creates the
+indexes and times them again.
+
+    python bench/index_lookup.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rows', type=int, default=100000)
+parser.add_argument('--lookups', type=int, default=500)
+parser.add_argument('--sessions', type=int, default=1000)
+args = parser.parse_args()
+
+db_path = tempfile.mktemp(suffix='.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import insert, text
+from app import app, db
+from app.models import Participant, Score, Response
+
+INDEXES = [
+    Participant.__table__.indexes,
+    Score.__table__.indexes,
+    Response.__table__.indexes,
+]
+
+def fill():
+    per_session = args.rows // args.sessions
+    participants = []
+    for participant_id in range(1, args.rows + 1):
+        participants.append({'id': participant_id, 'session_id': participant_id // per_session + 1,
+                             'user_id': participant_id})
+    db.session.execute(text('INSERT INTO participant (id, session_id, user_id, join_time) '
+                            "VALUES (:id, :session_id, :user_id, datetime('now'))"), participants)
+    db.session.execute(insert(Score), [{'session_id': p['session_id'], 'participant_id': p['id'], 'score': 0}
+                                       for p in participants])
+    db.session.execute(text('INSERT INTO response (session_id, participant_id, question_id, option_id, response_time) '
+                            "VALUES (:session_id, :id, :question_id, NULL, datetime('now'))"),
+                       [dict(p, question_id=p['id'] % 20) for p in participants])
+    db.session.commit()
+    return participants
+
+def time_lookups(participants):
+    sample = random.sample(participants, args.lookups)
+    results = {}
+    conn = db.session.connection()
+
+    started = time.perf_counter()
+    for p in sample:
+        conn.execute(text('SELECT id FROM participant WHERE session_id = :s AND user_id = :u'),
+                     {'s': p['session_id'], 'u': p['user_id']}).fetchall()
+    results['participant(session_id, user_id)'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for p in sample:
+        conn.execute(text('SELECT id, score FROM score WHERE session_id = :s AND participant_id = :p'),
+                     {'s': p['session_id'], 'p': p['id']}).fetchall()
+    results['score(session_id, participant_id)'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for p in sample:
+        conn.execute(text('SELECT participant_id FROM response WHERE session_id = :s AND question_id = :q'),
+                     {'s': p['session_id'], 'q': p['id'] % 20}).fetchall()
+    results['response(session_id, question_id)'] = time.perf_counter() - started
+    return results
+
+with app.app_context():
+    db.create_all()
+    for indexes in INDEXES:
+        for index in indexes:
+            index.drop(db.engine)
+    participants = fill()
+    before = time_lookups(participants)
+    for indexes in INDEXES:
+        for index in indexes:
+            index.create(db.engine)
+    db.session.execute(text('ANALYZE'))
+    after = time_lookups(participants)
+
+os.remove(db_path)
+print('{} rows, {} lookups each'.format(args.rows, args.lookups))
+print('{:<36} {:>14} {:>14} {:>9}'.format('lookup', 'no index (us)', 'indexed (us)', 'speedup'))
+for name in before:
+    without = before[name] / args.lookups * 1e6
+    indexed = after[name] / args.lookups * 1e6
+    print('{:<36} {:>14.1f} {:>14.1f} {:>8.0f}x'.format(name, without, indexed, without / indexed))
@@ -0,0 +1,297 @@
+"""Load test: full games over Socket.IO against a local eventlet server.
+
+Starts the app in a subprocess on a scratch SQLite database, registers
+--rooms x --players users through the REST routes, has each room's host
+create a quiz and a session, then drives every room concurrently through
+join_session, start_quiz and submit_answer with python-socketio clients.
+
+Reports answer-ack latency (submit_answer emit to its ack), question-advance
+latency (last answer of a question to the next question arriving) and events
+per second, and writes the numbers as JSON so runs can be compared across
+commits.
+
+    python bench/load_game.py --rooms 10 --players 20 --questions 10 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rooms', type=int, default=5)
+parser.add_argument('--players', type=int, default=10, help='players per room, host included')
+parser.add_argument('--questions', type=int, default=5)
+parser.add_argument('--think-ms', type=int, default=200, help='max random delay before answering')
+parser.add_argument('--transport', default='polling', choices=['polling', 'websocket'])
+parser.add_argument('--timeout', type=float, default=300)
+parser.add_argument('--seed', type=int, default=1)
+parser.add_argument('--port', type=int)
+parser.add_argument('--database-url')
+parser.add_argument('--output', help='write the JSON results here as well as to stdout')
+parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def serve():
+    sys.path.insert(0, ROOT)
+    from app import app, db, socketio
+    with app.app_context():
+        db.create_all()
+    socketio.run(app, host='127.0.0.1', port=args.port, log_output=False)
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def summary(values):
+    # Seconds in, milliseconds out
+    if not values:
+        return {'count': 0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 50) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': max(values) * 1000
+    }
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ack_latency = []
+        self.advance_latency = []
+        self.events_received = 0
+        self.events_sent = 0
+        self.errors = []
+
+    def received(self):
+        with self.lock:
+            self.events_received += 1
+
+    def sent(self):
+        with self.lock:
+            self.events_sent += 1
+
+class Room(object):
+    def __init__(self, base_url, code, headers, stats):
+        self.base_url = base_url
+        self.code = code
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.last_submit = {}
+        self.advanced = set()
+        self.finished = 0
+        self.done = threading.Event()
+        self.clients = [self.client(h) for h in headers]
+
+    def client(self, headers):
+        import socketio
+        sio = socketio.Client(reconnection=False)
+        stats = self.stats
+
+        @sio.on('*')
+        def any_event(event, *data):
+            stats.received()
+
+        @sio.on('message')
+        def message(data):
+            stats.received()
+
+        @sio.on('session_update')
+        def session_update(data):
+            stats.received()
+
+        @sio.on('error')
+        def error(data):
+            stats.received()
+            with stats.lock:
+                stats.errors.append(data.get('message'))
+
+        @sio.on('next_question')
+        def next_question(data):
+            stats.received()
+            self.question_opened(data['question_id'])
+            delay = random.uniform(0, args.think_ms / 1000.0)
+            threading.Timer(delay, self.submit, (sio, data)).start()
+
+        @sio.on('quiz_end')
+        def quiz_end(data):
+            stats.received()
+            with self.lock:
+                self.finished += 1
+                if self.finished == len(self.clients):
+                    self.done.set()
+
+        sio.connect(self.base_url, headers=headers, transports=[args.transport], wait_timeout=30)
+        return sio
+
+    def question_opened(self, question_id):
+        now = time.perf_counter()
+        with self.lock:
+            if question_id in self.advanced:
+                return
+            self.advanced.add(question_id)
+            # The first question has no previous answer to measure from
+            if self.last_submit:
+                self.stats.advance_latency.append(now - max(self.last_submit.values()))
+            self.last_submit = {}
+
+    def submit(self, sio, question):
+        option = random.choice(question['options'])
+        started = time.perf_counter()
+        with self.lock:
+            self.last_submit[id(sio)] = started
+
+        def ack(*_):
+            latency = time.perf_counter() - started
+            with self.stats.lock:
+                self.stats.ack_latency.append(latency)
+
+        self.stats.sent()
+        sio.emit('submit_answer', {'session_code': self.code, 'question_id': question['question_id'],
+                                   'option_id': option['id']}, callback=ack)
+
+    def join(self):
+        for sio in self.clients:
+            self.stats.sent()
+            sio.call('join_session', {'session_code': self.code}, timeout=30)
+
+    def start(self):
+        self.stats.sent()
+        self.clients[0].emit('start_quiz', {'session_code': self.code})
+
+    def close(self):
+        for sio in self.clients:
+            sio.disconnect()
+
+def setup_rooms(base_url, stats):
+    import requests
+    http = requests.Session()
+    rooms = []
+    for r in range(args.rooms):
+        headers = []
+        for p in range(args.players):
+            username = 'load{}_{}'.format(r, p)
+            http.post(base_url + '/register', json={'username': username, 'password': username,
+                                                     'email': username + '@example.com'}).raise_for_status()
+            token = http.post(base_url + '/login', json={'username': username, 'password': username})
+            token.raise_for_status()
+            headers.append({'Authorization': 'Bearer ' + token.json()['access_token']})
+        quiz = {'title': 'load {}'.format(r), 'questions': [
+            {'text': 'question {}'.format(q), 'time_limit': 600, 'options': [
+                {'text': 'option {}'.format(o), 'is_correct': o == 0} for o in range(4)]}
+            for q in range(args.questions)]}
+        response = http.post(base_url + '/create/quiz', json=quiz, headers=headers[0])
+        response.raise_for_status()
+        response = http.post(base_url + '/create/session', json={'quiz_id': response.json()['id']},
+                             headers=headers[0])
+        response.raise_for_status()
+        code = response.json()['session_code']
+        for h in headers[1:]:
+            http.post(base_url + '/join/session', json={'session_code': code}, headers=h).raise_for_status()
+        rooms.append(Room(base_url, code, headers, stats))
+    return rooms
+
+def wait_for_server(base_url, process):
+    import requests
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited with code {}'.format(process.returncode))
+        try:
+            requests.get(base_url + '/uid', timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run():
+    from engineio.payload import Payload
+    # The host gets an answer_stats per answer, so one poll can carry far
+    # more than the client's default of 16 packets
+    Payload.max_decode_packets = 100000
+    random.seed(args.seed)
+    port = args.port or free_port()
+    base_url = 'http://127.0.0.1:{}'.format(port)
+    env = dict(os.environ)
+    db_path = None
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        db_path = tempfile.mktemp(suffix='.db')
+        env['DATABASE_URL'] = 'sqlite:///' + db_path
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    stats = Stats()
+    rooms = []
+    try:
+        wait_for_server(base_url, server)
+        rooms = setup_rooms(base_url, stats)
+        for room in rooms:
+            room.join()
+
+        started = time.perf_counter()
+        for room in rooms:
+            room.start()
+        deadline = time.time() + args.timeout
+        for room in rooms:
+            room.done.wait(max(0, deadline - time.time()))
+        elapsed = time.perf_counter() - started
+    finally:
+        for room in rooms:
+            room.close()
+        server.terminate()
+        server.wait()
+        if db_path:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    results = {
+        'commit': git_commit(),
+        'params': {'rooms': args.rooms, 'players': args.players, 'questions': args.questions,
+                   'think_ms': args.think_ms, 'transport': args.transport, 'seed': args.seed},
+        'completed_rooms': sum(1 for room in rooms if room.done.is_set()),
+        'duration_s': elapsed,
+        'answer_ack': summary(stats.ack_latency),
+        'question_advance': summary(stats.advance_latency),
+        'events_received': stats.events_received,
+        'events_sent': stats.events_sent,
+        'events_per_second': (stats.events_received + stats.events_sent) / elapsed,
+        'errors': len(stats.errors),
+        'error_messages': sorted(set(stats.errors))
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if results['completed_rooms'] < args.rooms:
+        sys.exit(1)
+
+if args.serve:
+    serve()
+else:
+    run()
@@ -0,0 +1,82 @@
+"""Session creation throughput: the old two-commit sequence against the
+single unit-of-work transaction, and POST /create/session end to end.
+
+Runs against a scratch SQLite file by default. Pass --database-url to
+measure PostgreSQL; the tables are created and dropped again, so point it
+at a scratch database.
+
+    python bench/session_create.py --count 2000
+    python bench/session_create.py --database-url postgresql://localhost/kahoot_bench
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--count', type=int, default=1000)
+parser.add_argument('--database-url')
+args = parser.parse_args()
+
+db_path = None
+if args.database_url:
+    os.environ['DATABASE_URL'] = args.database_url
+else:
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app, db
+from app.models import User, Quiz, Question, Option, Session, Participant
+from app.utils import generate_unique_code, unit_of_work
+
+def two_commits(quiz, user):
+    session = Session(quiz_id=quiz.id, host_id=user.id, code=generate_unique_code())
+    db.session.add(session)
+    db.session.commit()
+    db.session.add(Participant(session_id=session.id, user_id=user.id))
+    db.session.commit()
+
+def one_transaction(quiz, user):
+    with unit_of_work() as uow:
+        session = Session(quiz_id=quiz.id, host_id=user.id, code=generate_unique_code())
+        uow.add(session)
+        uow.add(Participant(session=session, user_id=user.id))
+
+def run(name, func):
+    started = time.perf_counter()
+    for _ in range(args.count):
+        func()
+    elapsed = time.perf_counter() - started
+    print('{:<28} {:>8.0f} sessions/s  ({:.2f} ms each)'.format(
+        name, args.count / elapsed, elapsed / args.count * 1000))
+
+with app.app_context():
+    db.create_all()
+    try:
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        quiz = Quiz(title='bench', user_id=user.id)
+        question = Question(text='q', quiz=quiz)
+        question.options.append(Option(text='a', is_correct=True))
+        db.session.add(quiz)
+        db.session.commit()
+
+        print('{} on {}'.format(args.count, db.engine.dialect.name))
+        run('two commits', lambda: two_commits(quiz, user))
+        run('one transaction', lambda: one_transaction(quiz, user))
+
+        client = app.test_client()
+        token = client.post('/login', json={'username': 'bench', 'password': 'bench'}).json['access_token']
+        headers = {'Authorization': 'Bearer ' + token}
+        run('POST /create/session', lambda: client.post('/create/session', json={'quiz_id': quiz.id},
+                                                          headers=headers))
+    finally:
+        db.session.remove()
+        db.drop_all()
+
+if db_path:
+    os.remove(db_path)
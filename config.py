@@ -9,4 +9,68 @@ class Config(object):
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = 'your_jwt_secret_key'
-    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(minutes=21600)
\ No newline at end of file
+    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(minutes=21600)
+    # Answers are acknowledged immediately and persisted in batches
+    WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_INTERVAL_MS') or 200)
+    # A batch that fails this many retries is written row by row and rows
+    # that still fail are logged and dropped
+    WRITE_BEHIND_MAX_RETRIES = int(os.environ.get('WRITE_BEHIND_MAX_RETRIES') or 3)
+
+    # memory:// keeps game state in the process (single worker only). Use a
+    # redis:// URL, or sqlite:///path for several workers on one host, and set
+    # SOCKETIO_MESSAGE_QUEUE (e.g. redis://) so broadcasts reach every worker.
+    STATE_STORE_URL = os.environ.get('STATE_STORE_URL') or 'memory://'
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    # With a shared state store, how long a token revoked on one worker can
+    # still be accepted by the others
+    REVOCATION_REFRESH_MS = int(os.environ.get('REVOCATION_REFRESH_MS') or 1000)
+
+    # Number of entries sent in each per-question leaderboard_update
+    LEADERBOARD_TOP_K = int(os.environ.get('LEADERBOARD_TOP_K') or 10)
+
+    # Serialized quizzes kept for GET /quiz/<id>
+    QUIZ_CACHE_SIZE = int(os.environ.get('QUIZ_CACHE_SIZE') or 1024)
+
+    # Quizzes whose encoded question frames are kept for live games
+    QUESTION_FRAME_CACHE_SIZE = int(os.environ.get('QUESTION_FRAME_CACHE_SIZE') or 256)
+
+    # Points for an instant correct answer; a correct answer at the deadline gets half
+    QUESTION_POINTS = int(os.environ.get('QUESTION_POINTS') or 1000)
+
+    # Lobby joins and leaves are announced as deltas right away; the full
+    # session_update roster goes out at most this often per room
+    SESSION_UPDATE_INTERVAL_MS = int(os.environ.get('SESSION_UPDATE_INTERVAL_MS') or 250)
+
+    # A player whose sockets all drop mid-quiz stops holding up the room once
+    # they have been gone this long; resume_session brings them back
+    PRESENCE_GRACE_MS = int(os.environ.get('PRESENCE_GRACE_MS') or 5000)
+
+    # Fraction of socket events and HTTP requests whose latency, SQL count and
+    # SQL time are recorded for /metrics (call counts are always exact)
+    METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE') or 0.1)
+    # Level for app.logger; per-event chatter is logged at DEBUG
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'WARNING'
+
+    # Development SQL profiler (app/profiler.py): warns about handlers running
+    # more than SQL_QUERY_BUDGET statements and reports per handler at exit
+    SQL_PROFILE = os.environ.get('SQL_PROFILE', '').lower() in ('1', 'true', 'yes')
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET') or 10)
+
+    # /quiz/import inserts and commits this many quizzes at a time, and
+    # /quiz/export fetches this many rows at a time
+    QUIZ_IMPORT_BATCH_SIZE = int(os.environ.get('QUIZ_IMPORT_BATCH_SIZE') or 200)
+    QUIZ_EXPORT_YIELD_PER = int(os.environ.get('QUIZ_EXPORT_YIELD_PER') or 1000)
+
+    # Database engine profile. 'tuned' puts SQLite in WAL mode with
+    # synchronous=NORMAL, a busy timeout and memory-mapped reads, and gives
+    # server databases a bounded, pre-pinged connection pool. 'default'
+    # leaves SQLAlchemy's defaults alone. With PostgreSQL through psycopg2,
+    # install psycogreen too: psycopg2 otherwise blocks every greenlet on the
+    # worker for the length of each query, whatever the pool size.
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'tuned'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
@@ -0,0 +1,51 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# The app reads its config at import time, so point it at a scratch database first
+db_fd, db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+from app import app, db
+from app.profiler import query_budget as query_budget_block
+
+usernames = ('user{}'.format(n) for n in itertools.count())
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    with app.app_context():
+        db.create_all()
+    yield
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+@pytest.fixture
+def query_budget():
+    # with query_budget(3): ... fails the test if the block runs more than 3
+    # statements or repeats one (see app/profiler.py)
+    return query_budget_block
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+@pytest.fixture
+def auth_headers(client):
+    # A fresh user for each test, so quizzes from other tests stay out of its lists
+    username = next(usernames)
+    client.post('/register', json={'username': username, 'email': username + '@example.com', 'password': 'p'})
+    token = client.post('/login', json={'username': username, 'password': 'p'}).json['access_token']
+    return {'Authorization': 'Bearer ' + token}
+
+def make_quiz(questions, options=2):
+    return {'title': 'Quiz with {} questions'.format(questions), 'questions': [
+        {'text': 'Question {}'.format(q), 'options': [
+            {'text': 'Option {}'.format(o), 'is_correct': o == 0} for o in range(options)]}
+        for q in range(questions)]}
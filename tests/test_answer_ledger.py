@@ -0,0 +1,95 @@
+import random
+
+import eventlet
+import pytest
+
+from app import ledger as ledger_module
+from app.ledger import AnswerLedger
+from app.state import create_state_store
+
+# Concurrent submits, duplicates included, and disconnects at one room:
+# every participant is counted once per question and every question advances
+# exactly once. Each state store call yields to the hub first, so greenlets
+# interleave the way they do around real network round trips.
+
+PLAYERS = 200
+QUESTIONS = 3
+DUPLICATES = 2
+# Per question, players who disconnect instead of answering, and players who
+# disconnect right after answering
+DROPS = 10
+DROPS_AFTER_ANSWER = 5
+
+class YieldingStore(object):
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        def call(*args, **kwargs):
+            eventlet.sleep(0)
+            return method(*args, **kwargs)
+        return call
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    url = 'memory://' if request.param == 'memory' else 'sqlite:///' + str(tmp_path / 'state.db')
+    store = create_state_store(url)
+    monkeypatch.setattr(ledger_module, 'state', YieldingStore(store))
+    return store
+
+def test_each_question_advances_exactly_once(store):
+    ledger = AnswerLedger('STRESS')
+    assert ledger.claim()
+    ledger.start(PLAYERS)
+    question_ids = list(range(1, QUESTIONS + 1))
+    advances = dict.fromkeys(question_ids, 0)
+    duplicates = [0]
+
+    def close_if_complete(index, received):
+        # What submit_answer and participant_dropped do
+        if received >= ledger.expected_responses and ledger.advance(index):
+            advances[question_ids[index]] += 1
+
+    def submit(index, participant_id):
+        # Clients answer the question they were shown
+        received = ledger.record(question_ids[index], participant_id)
+        if received is None:
+            duplicates[0] += 1
+        else:
+            close_if_complete(index, received)
+
+    def drop(shown_index, participant_id):
+        # What participant_dropped does: the room may have moved on from the
+        # question the player was shown
+        index = ledger.current_question_index
+        if index < QUESTIONS and ledger.drop(participant_id, question_ids[index]):
+            close_if_complete(index, ledger.received(question_ids[index]))
+
+    def answer_and_drop(index, participant_id):
+        submit(index, participant_id)
+        drop(index, participant_id)
+
+    rng = random.Random(0)
+    players = list(range(PLAYERS))
+    expected_duplicates = 0
+    for index in range(QUESTIONS):
+        leaving, players = players[:DROPS], players[DROPS:]
+        calls = [(drop, participant_id) for participant_id in leaving]
+        # Answered, then left before everyone else had
+        leaving, players = players[:DROPS_AFTER_ANSWER], players[DROPS_AFTER_ANSWER:]
+        calls += [(answer_and_drop, participant_id) for participant_id in leaving]
+        calls += [(submit, participant_id) for participant_id in players for _ in range(DUPLICATES)]
+        rng.shuffle(calls)
+        expected_duplicates += len(players) * (DUPLICATES - 1)
+        pool = eventlet.GreenPool()
+        for call, participant_id in calls:
+            pool.spawn_n(call, index, participant_id)
+        pool.waitall()
+
+    assert advances == dict.fromkeys(question_ids, 1)
+    assert duplicates[0] == expected_duplicates
+    assert ledger.current_question_index == QUESTIONS
+    assert ledger.expected_responses == len(players)
+    assert not ledger.claim()
+    ledger.clear({question_id: {} for question_id in question_ids})
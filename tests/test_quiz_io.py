@@ -0,0 +1,19 @@
+import json
+from conftest import make_quiz
+
+def export(client, auth_headers, format):
+    return client.get('/quiz/export?format={}'.format(format), headers=auth_headers).get_data(as_text=True)
+
+def test_csv_round_trip_keeps_created_at(client, auth_headers):
+    created_at = '2024-01-02T03:04:05'
+    data = json.dumps(dict(make_quiz(2), created_at=created_at))
+    assert client.post('/quiz/import', data=data, headers=auth_headers).json == {'imported': 1}
+    response = client.post('/quiz/import?format=csv', data=export(client, auth_headers, 'csv'), headers=auth_headers)
+    assert response.json == {'imported': 1}
+    quizzes = [json.loads(line) for line in export(client, auth_headers, 'ndjson').splitlines()]
+    assert [quiz['created_at'] for quiz in quizzes] == [created_at, created_at]
+
+def test_csv_without_created_at_still_imports(client, auth_headers):
+    body = 'quiz,title,question,text,time_limit,option,is_correct\n1,Old,1,Question,10,Option,true\n'
+    response = client.post('/quiz/import?format=csv', data=body, headers=auth_headers)
+    assert response.json == {'imported': 1}
@@ -0,0 +1,15 @@
+import pytest
+from conftest import make_quiz
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-1', '101', '2.5', '', '%C2%B2'])
+def test_invalid_limit_is_rejected(client, auth_headers, limit):
+    response = client.get('/quiz/all?limit=' + limit, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_limit_pages_through_quizzes(client, auth_headers):
+    for _ in range(3):
+        client.post('/create/quiz', json=make_quiz(1), headers=auth_headers)
+    first = client.get('/quiz/all?limit=2', headers=auth_headers).json
+    assert len(first['quizzes']) == 2 and first['next_cursor']
+    second = client.get('/quiz/all?limit=2&cursor=' + first['next_cursor'], headers=auth_headers).json
+    assert len(second['quizzes']) == 1 and second['next_cursor'] is None
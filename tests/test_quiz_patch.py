@@ -0,0 +1,15 @@
+import pytest
+from conftest import make_quiz
+
+@pytest.mark.parametrize('title', [{'x': 1}, 123, '', None, ['a']])
+def test_title_must_be_a_string(client, auth_headers, title):
+    quiz_id = client.post('/create/quiz', json=make_quiz(1), headers=auth_headers).json['id']
+    response = client.patch('/quiz/{}'.format(quiz_id), json={'title': title}, headers=auth_headers)
+    assert response.status_code == 400
+    assert client.get('/quiz/{}'.format(quiz_id), headers=auth_headers).json['title'] == 'Quiz with 1 questions'
+
+def test_cannot_remove_the_last_question(client, auth_headers):
+    quiz = client.post('/create/quiz', json=make_quiz(1), headers=auth_headers).json
+    response = client.patch('/quiz/{}'.format(quiz['id']), json={'questions': {'remove': [quiz['questions'][0]['id']]}},
+                            headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+import pytest
+from app import app
+from app.utils import count_queries
+from conftest import make_quiz
+
+# Reading quizzes must cost the same number of statements however many
+# questions and options they have, so an N+1 shows up as a failure here
+
+SIZES = (1, 5, 20)
+
+def statements_for(client, url, headers):
+    with app.app_context(), count_queries() as statements:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return statements
+
+@pytest.mark.parametrize('url', ['/quiz/all', '/quiz/all?limit=50'])
+def test_quiz_list_queries_do_not_grow_with_quiz_size(client, auth_headers, url):
+    counts = []
+    for size in SIZES:
+        client.post('/create/quiz', json=make_quiz(size, options=4), headers=auth_headers)
+        counts.append(len(statements_for(client, url, auth_headers)))
+    assert len(set(counts)) == 1, 'statements per size {}: {}'.format(SIZES, counts)
+
+def test_quiz_detail_queries_do_not_grow_with_quiz_size(client, auth_headers):
+    counts = []
+    for size in SIZES:
+        quiz_id = client.post('/create/quiz', json=make_quiz(size, options=4), headers=auth_headers).json['id']
+        counts.append(len(statements_for(client, '/quiz/{}'.format(quiz_id), auth_headers)))
+    assert len(set(counts)) == 1, 'statements per size {}: {}'.format(SIZES, counts)
+
+def test_quiz_detail_stays_within_budget(client, auth_headers, query_budget):
+    quiz_id = client.post('/create/quiz', json=make_quiz(20, options=4), headers=auth_headers).json['id']
+    with query_budget(3):
+        client.get('/quiz/{}'.format(quiz_id), headers=auth_headers)